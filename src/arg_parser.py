@@ -1,9 +1,69 @@
 import argparse
 
+def shard(text):
+    '''
+        Shard given as k/N, with 1 <= k <= N.
+    '''
+    try:
+        index, count = map(int, text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected k/N, got {text}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"expected 1 <= k <= N, got {text}")
+    return index, count
+
+def get_merge_args(argv):
+    parser = argparse.ArgumentParser(prog = 'Remap Simulator merge',
+                                     description = 'Merges the tables of the shards of a run')
+    parser.add_argument("shards", nargs = "+", metavar = "TABLES",
+                        help = "out/tables folder of each shard")
+    parser.add_argument("-o", "--output", default = "out/tables",
+                        help = "folder of the merged tables")
+    return parser.parse_args(argv)
+
 def get_args():
     parser = argparse.ArgumentParser(prog = 'Remap Simulator',
                                      description = 'Uses the provided paths to simulate route remaps')
     parser.add_argument("-i", "--iface", required = True)
     parser.add_argument("-l", "--log_file", required = True)
     parser.add_argument("-p", "--path_folder", required = True)
+    parser.add_argument("--lazy", action = "store_true",
+                        help = "decode flowids and RTTs only when accessed")
+    parser.add_argument("--stream", action = "store_true",
+                        help = "load one (src, dst) group at a time")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+                        help = "processes used to load the paths folder")
+    parser.add_argument("--cache", action = "store_true",
+                        help = "keep the parsed paths in <path_folder>.cache")
+    parser.add_argument("--batch", action = "store_true",
+                        help = "compute the change zones of all samples at once")
+    parser.add_argument("-c", "--concurrency", type = int, default = 1,
+                        help = "remaps running at once")
+    parser.add_argument("--backend", choices = ["process", "worker", "standin", "emulator"],
+                        default = "process",
+                        help = "run remaproute once per TTL, in a long-lived worker, "
+                               "or answer with the expected solution from a worker "
+                               "or from this process")
+    parser.add_argument("--latency", type = float, default = 0.0,
+                        help = "seconds each remap takes with the emulator backend")
+    parser.add_argument("--remap-cache", metavar = "DB",
+                        help = "SQLite file keeping the output of each remap")
+    parser.add_argument("--remap-cache-mode", choices = ["record", "replay", "read-through"],
+                        default = "read-through",
+                        help = "store every output, only answer from the cache, "
+                               "or answer from it and store the remaps not found")
+    parser.add_argument("--checkpoint", metavar = "SECONDS", type = float, default = 300.0,
+                        help = "seconds between checkpoints of the tables")
+    parser.add_argument("--resume", action = "store_true",
+                        help = "continue the run saved in out/tables/checkpoint.json")
+    parser.add_argument("--sample-ttls", metavar = "RATE", type = float,
+                        help = "remap only a fraction (below 1) or a count of the TTLs "
+                               "of each zone, weighting their detection rows")
+    parser.add_argument("--sample-helpers", metavar = "RATE", type = float,
+                        help = "rate for the helper zones (default --sample-ttls)")
+    parser.add_argument("--seed", type = int, default = 0,
+                        help = "seed of the TTLs sampled")
+    parser.add_argument("--shard", metavar = "k/N", type = shard,
+                        help = "remap only the (src, dst) groups of shard k of N, "
+                               "keeping the sample ids of the whole folder")
     return parser.parse_args()
\ No newline at end of file
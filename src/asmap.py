@@ -0,0 +1,200 @@
+'''
+    Offline origin AS of IPv4 addresses, from a prefix to AS table such
+    as the CAIDA RouteViews pfx2as files. Run as
+
+        python3 src/asmap.py <prefix table> [ip...]
+
+    to build the cache of the table and print the AS of each IP.
+'''
+from array import array
+import bisect
+import gzip
+import os
+import re
+import struct
+import sys
+
+from cache import fingerprint
+from store import STAR_INT, IP_IDS, RouteStore, ip2int, read_column, write_column
+
+# AS of the addresses in no prefix of the table
+NO_AS = 0
+
+
+def read_prefixes(lines):
+    '''
+        Yield (first address, last address, AS) for each IPv4 prefix of
+        the lines of a table, either as `1.0.0.0<TAB>24<TAB>13335` in the
+        pfx2as format or as `1.0.0.0/24 13335`. Prefixes announced by
+        several ASes (`13335_4826` or `{13335,4826}`) take the first one.
+        Comments, IPv6 prefixes and malformed lines are skipped.
+    '''
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0].startswith("#") or ":" in fields[0]:
+            continue
+        if "/" in fields[0]:
+            fields = fields[0].split("/") + fields[1:]
+        if len(fields) < 3:
+            continue
+        asns = re.findall(r"\d+", fields[2])
+        try:
+            start, length = ip2int(fields[0]), int(fields[1])
+        except (OSError, ValueError):
+            continue
+        if not asns or not 0 <= length <= 32:
+            continue
+        size = 1 << (32 - length)
+        start &= ~(size - 1)
+        yield start, start + size - 1, int(asns[0])
+
+
+class ASMap:
+    '''
+        Longest prefix match of IPv4 addresses to their origin AS. The
+        prefixes of a table are flattened into disjoint intervals, kept
+        as two uint32 columns: the first address of each interval and
+        its AS, NO_AS between prefixes. An address is in the interval of
+        the last start not above it, so lookups are a bisection, and
+        batches of addresses are one numpy.searchsorted.
+
+        load() keeps the columns next to the table in `<table>.asmap`,
+        keyed by its path, size and mtime, so a table is only parsed
+        again when it changes.
+    '''
+    MAGIC = b"RTASMAP1"
+    HEADER = "<8s32s"
+
+    def __init__(self, starts : array, asns : array):
+        self.starts = starts
+        self.asns = asns
+
+    def __len__(self):
+        return len(self.starts)
+
+    @staticmethod
+    def build(prefixes):
+        '''
+            The map of (first address, last address, AS) prefixes. Longer
+            prefixes win over the ones holding them, and the last one wins
+            among equal prefixes.
+        '''
+        starts = array('I', [0])
+        asns = array('I', [NO_AS])
+
+        def mark(position, asn):
+            # From `position` on, addresses are in `asn`
+            if position > 0xFFFFFFFF:
+                return
+            if starts[-1] == position:
+                asns[-1] = asn
+            elif asns[-1] != asn:
+                starts.append(position)
+                asns.append(asn)
+
+        # Prefixes holding the current address, innermost last
+        enclosing = []
+        for start, end, asn in sorted(prefixes, key = lambda prefix : (prefix[0], -prefix[1])):
+            while enclosing and enclosing[-1][0] < start:
+                last, _ = enclosing.pop()
+                mark(last + 1, enclosing[-1][1] if enclosing else NO_AS)
+            mark(start, asn)
+            enclosing.append((end, asn))
+        while enclosing:
+            last, _ = enclosing.pop()
+            mark(last + 1, enclosing[-1][1] if enclosing else NO_AS)
+        return ASMap(starts, asns)
+
+    @staticmethod
+    def parse(path : str):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as file:
+            return ASMap.build(read_prefixes(file))
+
+    @staticmethod
+    def load(path : str):
+        '''
+            The map of the prefix table at `path`, from its cache if the
+            table did not change since it was written.
+        '''
+        key = fingerprint([path])
+        try:
+            with open(f"{path}.asmap", "rb") as file:
+                buffer = file.read()
+            magic, found = struct.unpack_from(ASMap.HEADER, buffer)
+            if (magic, found) == (ASMap.MAGIC, key):
+                starts, offset = read_column(buffer, struct.calcsize(ASMap.HEADER))
+                asns, _ = read_column(buffer, offset)
+                return ASMap(starts, asns)
+        except (OSError, struct.error):
+            pass
+        asmap = ASMap.parse(path)
+        asmap.save(f"{path}.asmap", key)
+        return asmap
+
+    def save(self, path : str, key : bytes):
+        # Like PathCache, failing to write the cache is not an error
+        try:
+            with open(f"{path}.{os.getpid()}", "wb") as file:
+                file.write(struct.pack(ASMap.HEADER, ASMap.MAGIC, key))
+                write_column(file, self.starts)
+                write_column(file, self.asns)
+            os.replace(f"{path}.{os.getpid()}", path)
+        except OSError:
+            pass
+
+    def __getitem__(self, ip) -> int | None:
+        '''
+            AS of an address, as text, int or IPv4Address, or None if no
+            prefix holds it, so a map can back Hop.asn.
+        '''
+        value = ip2int(ip) if isinstance(ip, str) else int(ip)
+        if value == STAR_INT:
+            return None
+        asn = self.asns[bisect.bisect_right(self.starts, value) - 1]
+        return None if asn == NO_AS else asn
+
+    def lookup(self, ips) -> array:
+        '''
+            AS of each address of a uint32 array or buffer, NO_AS for
+            stars and addresses in no prefix.
+        '''
+        import numpy as np
+
+        ips = np.frombuffer(ips, dtype = np.uint32) if not isinstance(ips, np.ndarray) else ips
+        starts = np.frombuffer(self.starts, dtype = np.uint32)
+        found = np.frombuffer(self.asns, dtype = np.uint32)[
+            np.searchsorted(starts, ips, side = "right") - 1]
+        found[ips == STAR_INT] = NO_AS
+        return array('I', found.tobytes())
+
+    def interned(self) -> array:
+        '''
+            AS of every interned IP, indexed by its id in store.IP_IDS.
+        '''
+        ips = array('I', bytes(4 * len(IP_IDS)))
+        for value, ip_id in IP_IDS.items():
+            ips[ip_id] = value
+        return self.lookup(ips)
+
+    def hop_asns(self, store : RouteStore) -> array:
+        '''
+            AS of the first interface of every hop of a store, indexed as
+            its hops: store.hop_range(rid) gives the ASes of a route. Hops
+            are stars or have no star interface, so this is Hop.asn() of
+            every hop in one pass.
+        '''
+        import numpy as np
+
+        ips = np.frombuffer(store.ips, dtype = np.uint32)
+        first = np.frombuffer(store.iface_offsets, dtype = np.uint32)[:-1]
+        return self.lookup(ips[first])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    asmap = ASMap.load(sys.argv[1])
+    print(f"{len(asmap)} intervals")
+    for ip in sys.argv[2:]:
+        print(ip, asmap[ip])
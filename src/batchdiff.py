@@ -0,0 +1,129 @@
+'''
+    Route differences for many pairs of routes at once. Each route is
+    encoded as a row of hop ids, with one id per distinct set of
+    interface IPs and id 0 for stars, and the branch and join points of
+    all pairs are found with array operations, one change per round.
+
+    Results are those of Route.diff with ALL_DIFFERENCE_OPTIONS, given
+    as the (i1, j1, i2, j2) indexes kept by RouteChange.
+'''
+import numpy as np
+
+from store import STAR_INT
+
+STAR = 0
+STAR_KEY = (STAR_INT,)
+
+# Padding of the rows of old and new routes, never equal to a hop id
+OLD_PAD = -1
+NEW_PAD = -2
+
+
+def encode(pairs : list[tuple[list[tuple], list[tuple]]]):
+    '''
+        Encode pairs of routes, given as the lists of hop keys returned
+        by Route.hop_keys(), into two padded matrices of hop ids and the
+        lengths of their rows.
+    '''
+    ids = {STAR_KEY: STAR}
+    width = max((max(len(old), len(new)) for old, new in pairs), default = 0)
+    old = np.full((len(pairs), width), OLD_PAD, dtype = np.int32)
+    new = np.full((len(pairs), width), NEW_PAD, dtype = np.int32)
+    old_len = np.empty(len(pairs), dtype = np.int64)
+    new_len = np.empty(len(pairs), dtype = np.int64)
+    for p, (old_keys, new_keys) in enumerate(pairs):
+        old[p, :len(old_keys)] = [ids.setdefault(key, len(ids)) for key in old_keys]
+        new[p, :len(new_keys)] = [ids.setdefault(key, len(ids)) for key in new_keys]
+        old_len[p] = len(old_keys)
+        new_len[p] = len(new_keys)
+    return old, new, old_len, new_len
+
+
+def skip_equal(old, new, old_len, new_len, i1, i2):
+    '''
+        Number of equal hops from (i1, i2) on in each row.
+    '''
+    offsets = np.arange(old.shape[1] + 1)
+    p1 = i1[:, None] + offsets
+    p2 = i2[:, None] + offsets
+    # The last offset is always past the end of both rows
+    valid = (p1 < old_len[:, None]) & (p2 < new_len[:, None])
+    last = old.shape[1] - 1
+    equal = (np.take_along_axis(old, np.minimum(p1, last), 1)
+             == np.take_along_axis(new, np.minimum(p2, last), 1))
+    return np.argmin(valid & equal, axis = 1)
+
+
+def join(old, new, i1, i2):
+    '''
+        First hop of the new route after i2, not a star, that is also in
+        the old route after i1, and its first position in the old route.
+        Rows where there is none are marked in `found`.
+    '''
+    columns = np.arange(old.shape[1])
+    match = old[:, :, None] == new[:, None, :]
+    match &= (columns >= i1[:, None])[:, :, None]
+    match &= ((columns >= i2[:, None]) & (new != STAR))[:, None, :]
+    hit = match.any(axis = 1)
+    found = hit.any(axis = 1)
+    j2 = np.argmax(hit, axis = 1)
+    j1 = np.argmax(match[np.arange(len(j2)), :, j2], axis = 1)
+    return j1, j2, found
+
+
+def diff(old, new, old_len, new_len, block : int = 1 << 24) -> list[list[tuple]]:
+    '''
+        Changes between the rows of encode(), as lists of (i1, j1, i2,
+        j2) per pair. The join points are searched comparing every hop
+        of both rows, in blocks of about `block` comparisons.
+    '''
+    count, width = old.shape
+    changes = [[] for _ in range(count)]
+    i1 = np.zeros(count, dtype = np.int64)
+    i2 = np.zeros(count, dtype = np.int64)
+    active = np.arange(count)
+    rows = max(1, block // max(1, width * width))
+
+    while active.size:
+        a1, a2 = i1[active], i2[active]
+        l1, l2 = old_len[active], new_len[active]
+        step = skip_equal(old[active], new[active], l1, l2, a1, a2)
+        a1 += step
+        a2 += step
+
+        # Pairs at the end of a route, with a last change if the other
+        # route has hops left
+        done = (a1 >= l1) | (a2 >= l2)
+        for p, b1, b2, e1, e2 in zip(active[done].tolist(), a1[done].tolist(),
+                                     a2[done].tolist(), l1[done].tolist(),
+                                     l2[done].tolist()):
+            if b1 != e1 or b2 != e2:
+                changes[p].append((b1 - 1, e1, b2 - 1, e2))
+
+        active, a1, a2 = active[~done], a1[~done], a2[~done]
+        l1, l2 = l1[~done], l2[~done]
+        j1 = np.empty_like(a1)
+        j2 = np.empty_like(a2)
+        for start in range(0, active.size, rows):
+            part = slice(start, start + rows)
+            p = active[part]
+            b1, b2, found = join(old[p], new[p], a1[part], a2[part])
+            j1[part] = np.where(found, b1, l1[part])
+            j2[part] = np.where(found, b2, l2[part])
+
+        for p, b1, b2, e1, e2 in zip(active.tolist(), a1.tolist(), a2.tolist(),
+                                     j1.tolist(), j2.tolist()):
+            changes[p].append((b1 - 1, e1, b2 - 1, e2))
+        i1[active] = j1
+        i2[active] = j2
+
+    return changes
+
+
+def batch_diff(pairs : list[tuple[list[tuple], list[tuple]]]) -> list[list[tuple]]:
+    '''
+        Changes of each pair of hop key lists, see encode() and diff().
+    '''
+    if not pairs:
+        return []
+    return diff(*encode(pairs))
@@ -0,0 +1,664 @@
+'''
+    Benchmarks for the simulator pipeline. Run as
+
+        python3 src/bench.py <benchmark> [-p path_folder] [-n lines]
+
+    When no paths folder is given, synthetic traceroutes are used.
+'''
+from collections import defaultdict
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from paths import PathManager
+from route import *
+from store import STAR_INT, RouteStore, address, ip2int
+import tables
+
+STARSTR = "255.255.255.255:0:0.00,0.00,0.00,0.00:"
+
+
+def synthetic_ip(rand):
+    return "%d.%d.%d.%d" % (rand.randint(1, 223), rand.randint(0, 255),
+                            rand.randint(0, 255), rand.randint(1, 254))
+
+
+def synthetic_lines(count, hops = 30, seed = 0):
+    '''
+        Traceroute lines in the format read by PathManager.build_route,
+        with stars and load balancers, for groups of 10 measures per
+        (src, dst) pair.
+    '''
+    rand = random.Random(seed)
+    lines = []
+    while len(lines) < count:
+        src, dst = synthetic_ip(rand), synthetic_ip(rand)
+        path = [[synthetic_ip(rand) for _ in range(rand.choice([1, 1, 1, 2]))]
+                for _ in range(hops - 1)] + [[dst]]
+        tstamp = rand.randint(10**9, 2 * 10**9)
+        for _ in range(10):
+            if rand.random() < 0.3:
+                # Route change: a segment replaced by one of another length
+                i = rand.randint(0, len(path) - 2)
+                j = min(i + rand.randint(1, 6), len(path) - 1)
+                path[i:j] = [[synthetic_ip(rand)] for _ in range(rand.randint(1, 6))]
+            hopstrs = []
+            for ips in path:
+                if rand.random() < 0.05:
+                    hopstrs.append(STARSTR)
+                    continue
+                hopstrs.append(';'.join(
+                    "%s:1,2,3,4,5,6:%.2f,%.2f,%.2f,%.2f:" % (ip, 1.25, 2.5, 3.75, 0.5)
+                    for ip in ips))
+            tstamp += rand.randint(60, 600)
+            lines.append(f"{rand.randint(10, 900)} {src} {dst} {tstamp} {'|'.join(hopstrs)}")
+    return lines[:count]
+
+
+def load_lines(args):
+    if not args.path_folder:
+        return synthetic_lines(args.lines, args.hops)
+    lines = []
+    for path_file in sorted(os.listdir(args.path_folder)):
+        with open(f"{args.path_folder}/{path_file}") as content:
+            lines.extend(content)
+    return lines[:args.lines]
+
+
+def path_folder(args, files = 8):
+    '''
+        The paths folder of the arguments, or a temporary one with the
+        synthetic lines split over `files` files.
+    '''
+    if args.path_folder:
+        return args.path_folder
+    folder = tempfile.mkdtemp(prefix = "bench_paths_")
+    lines = synthetic_lines(args.lines, args.hops)
+    size = len(lines) // files + 1
+    for i in range(files):
+        with open(f"{folder}/paths_{i}.txt", "w") as content:
+            content.write("\n".join(lines[i*size:(i+1)*size]) + "\n")
+    return folder
+
+
+def traced(build):
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def memory(args):
+    lines = load_lines(args)
+
+    def objects(lazy):
+        return lambda : [PathManager.build_route(line, lazy = lazy) for line in lines]
+
+    def packed(lazy):
+        def build():
+            store = RouteStore(lazy)
+            routes = []
+            for line in lines:
+                route = PathManager.build_route(line, store, lazy)
+                route.pack()
+                routes.append(route)
+            return routes
+        return build
+
+    print(f"{len(lines)} routes")
+    for name, build in [("objects", objects(False)),
+                        ("objects lazy", objects(True)),
+                        ("store", packed(False)),
+                        ("store lazy", packed(True))]:
+        routes, size, elapsed = traced(build)
+        print(f"\t{name:14} {size / len(routes):10.0f} bytes/route"
+              f" {len(routes) / elapsed:10.0f} lines/s")
+        del routes
+
+
+def ingest(args):
+    folder = path_folder(args)
+    jobs = 1
+    base = None
+    while True:
+        start = time.perf_counter()
+        samples = PathManager.explore(folder, jobs = jobs)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f"\t{jobs:3} jobs {elapsed:8.2f} s {len(samples) / elapsed:10.0f} samples/s"
+              f" {base / elapsed:6.2f}x")
+        if jobs >= args.jobs: break
+        jobs = min(2 * jobs, args.jobs)
+
+
+def cache(args):
+    folder = path_folder(args)
+    for name, kwargs in [("no cache", {}),
+                         ("cold cache", {"cache": True}),
+                         ("warm cache", {"cache": True})]:
+        start = time.perf_counter()
+        samples = PathManager.explore(folder, **kwargs)
+        elapsed = time.perf_counter() - start
+        print(f"\t{name:12} {elapsed:8.2f} s {len(samples)} samples")
+
+
+def route_groups(lines, store = None):
+    groups = defaultdict(list)
+    for line in lines:
+        route = PathManager.read_route(line, store)
+        if route is not None:
+            groups[route.src, route.dst].append(route)
+    return list(groups.values())
+
+
+def route_pairs(lines):
+    '''
+        Pairs of time adjacent routes, parsed again on each call since
+        Route.diff changes the routes it is given.
+    '''
+    pairs = []
+    for group in route_groups(lines):
+        group.sort(key = lambda route : route.tstamp)
+        pairs.extend(zip(group, group[1:]))
+    return pairs
+
+
+def diff(args):
+    '''
+        Time Route.diff for every option set, and repeated comparisons
+        answered by its memo. tests/test_diff.py checks the changes it
+        finds against recorded ones.
+    '''
+    lines = load_lines(args)
+    option_sets = [
+        ("default", ALL_DIFFERENCE_OPTIONS),
+        ("balancers", frozenset([RouteDifferenceOption.IGNORE_BALANCERS])),
+        ("fix", frozenset([RouteDifferenceOption.FIX_UNRESPONSIVE])),
+        ("fix+fill", frozenset([RouteDifferenceOption.FIX_UNRESPONSIVE,
+                                RouteDifferenceOption.FILL_MISSING_HOPS])),
+        ("all", frozenset(RouteDifferenceOption)),
+    ]
+
+    for name, options in option_sets:
+        pairs = route_pairs(lines)
+        changes = failed = 0
+        start = time.perf_counter()
+        for r1, r2 in pairs:
+            try:
+                changes += len(Route.diff(r1, r2, options))
+            except AssertionError:
+                failed += 1
+        elapsed = time.perf_counter() - start
+        print(f"\t{name:10} {len(pairs)} pairs {elapsed:6.2f} s {changes} changes"
+              f" {failed} assertion errors")
+
+    # Repeated comparisons of the same pairs are answered by the memo
+    pairs = route_pairs(lines)[:Route.MEMO_SIZE]
+    for name in ("first ==", "memo =="):
+        start = time.perf_counter()
+        for r1, r2 in pairs:
+            r1 == r2
+        print(f"\t{name:10} {len(pairs)} pairs {time.perf_counter() - start:6.3f} s")
+
+
+def batch(args):
+    '''
+        Time the samples of all groups built one diff at a time and with
+        batchdiff, checking that both find the same remap zones.
+    '''
+    lines = load_lines(args)
+
+    def run(build):
+        groups = route_groups(lines, RouteStore())
+        start = time.perf_counter()
+        samples = build(groups)
+        elapsed = time.perf_counter() - start
+        zones = [[(real, zone.i1, zone.j1, zone.i2, zone.j2) for real, zone in sample.lczs]
+                 for sample in samples]
+        return zones, elapsed
+
+    def serial(groups):
+        samples = []
+        for group in groups:
+            samples.extend(PathManager.group_samples(group))
+        return samples
+
+    expected, serial_time = run(serial)
+    found, batch_time = run(PathManager.batch_samples)
+    wrong = sum(a != b for a, b in zip(expected, found)) + abs(len(expected) - len(found))
+    print(f"\t{len(found)} samples serial {serial_time:6.2f} s"
+          f" batch {batch_time:6.2f} s {serial_time / batch_time:6.2f}x {wrong} mismatches")
+    if wrong:
+        exit(1)
+
+
+def table(args):
+    '''
+        Time tables.add_row on the detection table, per row, as the
+        table grows to 100 times `-n` rows.
+    '''
+    folder = tempfile.mkdtemp(prefix = "bench_tables_")
+    tables.start(folder)
+    row = [0, 0, 10, 3, 40, 50, 12.5, True, False, False, 1.0]
+    total = 0
+    for size in (args.lines, 10 * args.lines, 100 * args.lines):
+        start = time.perf_counter()
+        for _ in range(size - total):
+            tables.add_row('detection', row)
+        elapsed = time.perf_counter() - start
+        print(f"\t{size:10} rows {elapsed / (size - total) * 1e6:8.2f} us/row")
+        total = size
+    tables.save(folder)
+
+
+def worker(args):
+    '''
+        Time remap jobs answered by the stand-in worker, started once
+        per job and once for all of them with `-j` jobs at once.
+    '''
+    from remapper import Remapper
+    from remapworker import WorkerClient
+
+    samples = PathManager.explore(path_folder(args))
+    jobs = [Remapper.job(sample, zone.i2 + 1) for sample in samples
+            for real, zone in sample.lczs if real][:200]
+
+    start = time.perf_counter()
+    for job in jobs:
+        client = WorkerClient.start(None, None, None, standin = True)
+        client.run(job)
+        client.close()
+    elapsed = time.perf_counter() - start
+    print(f"\t{'per job':10} {len(jobs) / elapsed:10.1f} jobs/s")
+
+    start = time.perf_counter()
+    client = WorkerClient.start(None, None, None, standin = True, concurrency = args.jobs)
+    futures = [client.submit(job) for job in jobs]
+    for future in futures:
+        future.result()
+    client.close()
+    elapsed = time.perf_counter() - start
+    print(f"\t{'worker':10} {len(jobs) / elapsed:10.1f} jobs/s")
+
+
+def remap(args):
+    '''
+        Samples per second through Remapper.map with the emulator
+        backend, without latency and with `--latency` seconds per
+        remap, from 1 up to `-j` remaps at once.
+    '''
+    from remapbackend import EmulatorBackend
+    from remapper import Remapper
+
+    samples = PathManager.explore(path_folder(args))
+    jobs = [(id, sample, zone.i2 + 1) for id, sample in enumerate(samples)
+            for real, zone in sample.lczs if real]
+
+    for latency in (0.0, args.latency):
+        workers = 1
+        while workers <= args.jobs:
+            remapper = Remapper(EmulatorBackend(None, None, None, latency))
+            start = time.perf_counter()
+            remapped = {id for id, _ in remapper.map(jobs, workers)}
+            elapsed = time.perf_counter() - start
+            remapper.close()
+            print(f"\t{latency * 1000:6.1f} ms {workers:3} workers "
+                  f"{len(remapped) / elapsed:10.1f} samples/s "
+                  f"{len(jobs) / elapsed:10.1f} remaps/s")
+            workers *= 2
+
+
+def synthetic_tables(count, seed = 0, lengths = (5, 30)):
+    '''
+        sample, zone and detection tables of `count` samples with 1 to 3
+        zones each and 1 to 7 detection rows per zone, and new paths of
+        `lengths` hops, end excluded.
+    '''
+    import numpy as np
+    import pandas as pd
+
+    rand = np.random.default_rng(seed)
+    new_path_len = rand.integers(*lengths, count)
+    sample = pd.DataFrame({
+        'sample_id': np.arange(count),
+        'old_path_len': new_path_len + rand.integers(-2, 3, count),
+        'new_path_len': new_path_len,
+        'has_change': True,
+        'twist': rand.random(count) < 0.01
+    })
+
+    zones = rand.integers(1, 4, count)
+    zone_sample = np.repeat(np.arange(count), zones)
+    zone_id = np.arange(len(zone_sample)) - np.repeat(np.cumsum(zones) - zones, zones)
+    zone = pd.DataFrame({
+        'sample_id': zone_sample,
+        'zone_id': zone_id,
+        'old_len': rand.integers(0, 5, len(zone_sample)),
+        'new_len': rand.integers(0, 5, len(zone_sample))
+    })
+
+    rows = rand.integers(1, 8, len(zone_sample))
+    total = rows.sum()
+    detection = pd.DataFrame({
+        'sample_id': np.repeat(zone_sample, rows),
+        'zone_id': np.repeat(zone_id, rows),
+        'ttl': rand.integers(1, 30, total),
+        'measures': rand.integers(1, 12, total),
+        'probing_cost_local': rand.integers(6, 200, total),
+        'probing_cost_complete': rand.integers(20, 180, total),
+        'latency': rand.random(total) * 100,
+        'multiple_remap': rand.random(total) < 0.3,
+        'reach_end': rand.random(total) < 0.2,
+        'not_remaped': rand.random(total) < 0.1,
+        'weight': 1.0
+    })
+    return sample, zone, detection
+
+
+def stats(args):
+    '''
+        Time stats.summary on synthetic tables of 100 times `-n` samples,
+        several million detection rows, then StatsStore on tables of `-n`
+        samples, with and without paths shorter than 10 and longer than
+        20 hops, failing if any metric or graph series differs from the
+        ones of summary. tests/test_stats.py checks summary against
+        recorded ones.
+    '''
+    import numpy as np
+    from stats import summary
+
+    sample, zone, detection = synthetic_tables(100 * args.lines)
+    start = time.perf_counter()
+    summary(sample, zone, detection)
+    elapsed = time.perf_counter() - start
+    print(f"\t{len(detection):10} rows summary {elapsed:8.2f} s")
+
+    # StatsStore on tables of -n samples, and on tables with no short or
+    # long path, written as simulate does
+    from statstore import StatsStore
+    from stats import figures
+    mismatches = 0
+    for name, lengths in (("store", (5, 30)), ("store 10-20", (10, 21))):
+        tables = synthetic_tables(args.lines, lengths = lengths)
+        folder = tempfile.mkdtemp(prefix = "bench_stats_")
+        for table_name, table in zip(("sample", "zone", "detection"), tables):
+            table.to_csv(f"{folder}/{table_name}.csv")
+        expected, expected_plot = summary(*tables)
+        start = time.perf_counter()
+        store = StatsStore(folder)
+        store.update()
+        output, plot_data = store.summary()
+        elapsed = time.perf_counter() - start
+        points = lambda plot_data : [p[:3] for job, _ in figures(plot_data) for p in job]
+        failed = int(not np.array_equal(output['value'].values, expected['value'].values,
+                                        equal_nan = True))
+        failed += points(plot_data) != points(expected_plot)
+        print(f"\t{name:12} {len(tables[2]):10} rows {elapsed:8.3f} s "
+              f"{failed} mismatches")
+        mismatches += failed
+    if mismatches:
+        raise SystemExit(1)
+
+
+def cdf(args):
+    '''
+        Time scratch.gen_cdf_list against the count per key version it
+        replaced, and check that the CDFs downsampled to 1000 points
+        stay within 1/1000 of the full ones.
+    '''
+    import numpy as np
+    import scratch
+
+    def reference_cdf(elements):
+        total = len(elements)
+        keys = sorted(set(elements))
+        acc, cdf = 0, []
+        for key in keys:
+            acc += elements.count(key)
+            cdf.append((key, acc / float(total)))
+        return cdf
+
+    rand = np.random.default_rng(0)
+    values = np.round(rand.lognormal(3, 1, 100 * args.lines), 1)
+    small = values[:args.lines].tolist()
+    start = time.perf_counter()
+    expected = reference_cdf(small)
+    reference_time = time.perf_counter() - start
+    start = time.perf_counter()
+    found = scratch.gen_cdf_list(small)
+    elapsed = time.perf_counter() - start
+    print(f"\t{len(small):10} values reference {reference_time:8.3f} s "
+          f"numpy {elapsed:8.4f} s {'same' if found == expected else 'DIFFERENT'}")
+
+    start = time.perf_counter()
+    full = scratch.gen_cdf_list(values)
+    elapsed = time.perf_counter() - start
+    keys = np.array([key for key, _ in full])
+    fractions = np.array([fraction for _, fraction in full])
+    down = scratch.gen_cdf_list(values, points = 1000)
+    down_keys = np.array([key for key, _ in down])
+    down_fractions = np.array([fraction for _, fraction in down])
+    # Step curve of the downsampled CDF at every key of the full one
+    drawn = down_fractions[np.searchsorted(down_keys, keys, side = "right") - 1]
+    error = np.abs(fractions - drawn).max()
+    print(f"\t{len(values):10} values numpy {elapsed:8.3f} s {len(full):8} steps, "
+          f"{len(down)} downsampled, max error {error:.5f}")
+    if found != expected or error >= 1 / 1000:
+        raise SystemExit(1)
+
+def asn(args):
+    '''
+        Build an asmap.ASMap from a synthetic table of 100 times `-n`
+        nested prefixes and load it again from its cache, then time the
+        AS of every hop of the routes, one Hop.asn at a time and in one
+        hop_asns pass, failing if any differs from a longest prefix
+        match over the table.
+    '''
+    import numpy
+    from asmap import ASMap
+
+    rand = random.Random(0)
+    prefixes = dict()
+    for _ in range(100 * args.lines):
+        length = rand.choice([8, 12, 16, 19, 20, 22, 23, 24, 24, 24])
+        mask = (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+        prefixes[ip2int(synthetic_ip(rand)) & mask, length] = rand.randint(1, 65000)
+    folder = tempfile.mkdtemp(prefix = "bench_asn_")
+    table = f"{folder}/pfx2as.txt"
+    with open(table, "w") as content:
+        for (start, length), number in prefixes.items():
+            content.write(f"{address(start)}\t{length}\t{number}\n")
+
+    for name in ("build", "cached"):
+        start = time.perf_counter()
+        asmap = ASMap.load(table)
+        elapsed = time.perf_counter() - start
+        print(f"\t{name:8} {elapsed:8.3f} s {len(prefixes)} prefixes, {len(asmap)} intervals")
+
+    def reference(hop):
+        for iface in hop.ifaces:
+            if iface.ip == STAR:
+                continue
+            value = int(iface.ip)
+            for length in range(32, -1, -1):
+                mask = (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+                found = prefixes.get((value & mask, length))
+                if found is not None:
+                    return found
+            return None
+
+    store = RouteStore()
+    route_groups(load_lines(args), store)
+    routes = [Route.view(store, rid) for rid in range(len(store))]
+    hops = [hop for route in routes for hop in route.hops]
+    expected = [reference(hop) for hop in hops]
+
+    start = time.perf_counter()
+    found = [hop.asn(asmap) for hop in hops]
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = asmap.hop_asns(store)
+    batch_time = time.perf_counter() - start
+    batch = [number or None for number in batch]
+    mismatches = sum(a != b for a, b in zip(expected, found)) \
+        + sum(a != b for a, b in zip(expected, batch)) + (len(batch) != len(hops))
+    print(f"\t{len(hops):10} hops Hop.asn {elapsed:8.3f} s hop_asns {batch_time:8.4f} s "
+          f"{elapsed / batch_time:8.1f}x, {sum(a is not None for a in expected)} in a prefix, "
+          f"{mismatches} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def mapper(args):
+    '''
+        Index the routes of the lines in a RouteMapper, query the routes
+        crossing pairs of IPs, then remove half of the routes and query
+        again, failing if any query differs from sets of routes built
+        from every interface.
+    '''
+    import numpy
+
+    store = RouteStore()
+    routes = [route for group in route_groups(load_lines(args), store) for route in group]
+    # Routes by identity, as Route.__eq__ compares their hops
+    reference = defaultdict(set)
+    for route in routes:
+        for ip in [ip for key in route.hop_keys() for ip in key] + [int(route.dst)]:
+            reference[ip].add(id(route))
+    reference.pop(STAR_INT, None)
+
+    def build():
+        index = RouteMapper()
+        for route in routes:
+            index.add(route)
+        return index
+    index, size, elapsed = traced(build)
+    print(f"\t{len(routes):10} routes add {elapsed:8.3f} s {size / len(routes):8.0f} bytes/route, "
+          f"{len(index.ip2routes)} IPs")
+
+    rand = random.Random(0)
+    mismatches = 0
+    for step in ("all routes", "half removed"):
+        pairs = []
+        for _ in range(2000):
+            keys = [key for key in rand.choice(routes).hop_keys() if key[0] != STAR_INT]
+            pairs.append((rand.choice(keys)[0], rand.choice(keys)[0]))
+        ips = list(reference)
+        pairs += [(rand.choice(ips), rand.choice(ips)) for _ in range(2000)]
+        start = time.perf_counter()
+        found = [index.crossing(a, b) for a, b in pairs]
+        elapsed = time.perf_counter() - start
+        for (a, b), crossing in zip(pairs, found):
+            mismatches += set(map(id, crossing)) != reference.get(a, set()) & reference.get(b, set())
+            mismatches += list(crossing) != sorted(crossing, key = lambda route : index.ids[id(route)])
+        print(f"\t{step:12} {len(pairs)} pair queries {elapsed:8.3f} s, "
+              f"{sum(map(len, found)) / len(found):6.1f} routes each, {mismatches} mismatches")
+        if step == "all routes":
+            removed = rand.sample(routes, len(routes) // 2)
+            start = time.perf_counter()
+            for route in removed:
+                index.remove(route)
+            elapsed = time.perf_counter() - start
+            print(f"\t{len(removed):10} routes remove {elapsed:8.3f} s")
+            for route in removed:
+                for ip in [ip for key in route.hop_keys() for ip in key] + [int(route.dst)]:
+                    reference.get(ip, set()).discard(id(route))
+            routes = [route for route in routes if id(route) in index.ids]
+    if mismatches or len(index) != len(routes):
+        raise SystemExit(1)
+
+
+
+# Most milliseconds each module may take to import, with the modules it
+# imports, in a new interpreter. simulate and remapworker are started
+# for every run and remap job, and stats needs pandas but not matplotlib
+# until a graph is plotted.
+IMPORT_BUDGETS = {
+    "tables": 30,
+    "plot": 30,
+    "route": 100,
+    "remapworker": 100,
+    "paths": 150,
+    "remapper": 170,
+    "simulate": 180,
+    "stats": 700,
+}
+
+
+def import_times(module):
+    '''
+        (self, cumulative) microseconds of each module imported by
+        `module` in a new interpreter, from -X importtime.
+    '''
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd = os.path.dirname(os.path.abspath(__file__)),
+                         capture_output = True, text = True, check = True)
+    times = []
+    for line in run.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times.append((name[1:].rstrip(), int(own), int(cumulative)))
+    return times
+
+
+def imports(args):
+    '''
+        Import time of each module of IMPORT_BUDGETS, the best of 3 new
+        interpreters, with its 3 slowest direct imports, failing if any
+        module is over its budget.
+    '''
+    over = []
+    for module, budget in IMPORT_BUDGETS.items():
+        runs = [import_times(module) for _ in range(3)]
+        times = min(runs, key = lambda times : times[-1][2])
+        elapsed = times[-1][2] / 1000
+        slowest = sorted((t for t in times if t[0].startswith("  ") and t[0][2] != " "),
+                         key = lambda t : -t[2])[:3]
+        print(f"\t{module:12} {elapsed:8.1f} ms of {budget:5} ms  "
+              + ", ".join(f"{name.strip()} {cumulative / 1000:.1f}" for name, _, cumulative in slowest))
+        if elapsed > budget:
+            over.append(module)
+    if over:
+        print(f"\tover budget: {', '.join(over)}")
+        raise SystemExit(1)
+
+
+BENCHMARKS = {
+    "memory": memory,
+    "ingest": ingest,
+    "cache": cache,
+    "diff": diff,
+    "batch": batch,
+    "table": table,
+    "worker": worker,
+    "remap": remap,
+    "stats": stats,
+    "cdf": cdf,
+    "asn": asn,
+    "mapper": mapper,
+    "imports": imports,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = 'Remap Simulator Benchmarks')
+    parser.add_argument("benchmark", choices = BENCHMARKS)
+    parser.add_argument("-p", "--path_folder")
+    parser.add_argument("-n", "--lines", type = int, default = 5000)
+    parser.add_argument("--hops", type = int, default = 30,
+                        help = "length of the synthetic routes")
+    parser.add_argument("-j", "--jobs", type = int, default = os.cpu_count())
+    parser.add_argument("--latency", type = float, default = 0.005,
+                        help = "seconds per remap for the remap benchmark")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
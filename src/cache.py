@@ -0,0 +1,125 @@
+from array import array
+import hashlib
+import mmap
+import os
+import struct
+
+from route import Route
+from store import RouteStore, read_column, write_column
+
+
+def fingerprint(paths : list[str], salt : str = "") -> bytes:
+    '''
+        Hash of the path, size and mtime of each file, in order.
+    '''
+    digest = hashlib.sha256(salt.encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path} {stat.st_size} {stat.st_mtime_ns}\n".encode())
+    return digest.digest()
+
+
+class PathCache:
+    '''
+        Binary cache of a paths folder, kept next to it in the folder
+        `<folder>.cache`. Each measure file has its own entry with its
+        parsed routes, keyed by the file path, size and mtime, so a
+        changed file only invalidates its own entry. The remap zones of
+        all samples are kept in one more entry, keyed by all the files.
+
+        Entries are written to a temporary file and renamed, so workers
+        can fill the cache concurrently. Failing to write is not an error.
+    '''
+    MAGIC = b"RTCACHE2"
+    ROUTES = "<8sQqQQ"
+    ZONES = "<8s32s"
+
+    def __init__(self, folder : str, lazy : bool = False):
+        self.folder = folder.rstrip("/")
+        self.dir = f"{self.folder}.cache"
+        self.lazy = lazy
+
+    def entry(self, path : str) -> str:
+        return f"{self.dir}/{os.path.basename(path)}.routes"
+
+    def write(self, path : str, write):
+        try:
+            os.makedirs(self.dir, exist_ok = True)
+            with open(f"{path}.{os.getpid()}", "wb") as file:
+                write(file)
+            os.replace(f"{path}.{os.getpid()}", path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def read(path : str):
+        try:
+            with open(path, "rb") as file:
+                return mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    def load_routes(self, path : str):
+        '''
+            Return the routes and info counters cached for measure file
+            `path`, or None if its entry is missing or out of date.
+        '''
+        buffer = PathCache.read(self.entry(path))
+        if buffer is None:
+            return None
+        with buffer:
+            stat = os.stat(path)
+            magic, size, mtime, has_dst, no_dst = struct.unpack_from(PathCache.ROUTES, buffer)
+            if (magic, size, mtime) != (PathCache.MAGIC, stat.st_size, stat.st_mtime_ns):
+                return None
+            store = RouteStore.load(buffer, struct.calcsize(PathCache.ROUTES))
+        if store.lazy != self.lazy:
+            return None
+        routes = [Route.view(store, rid) for rid in range(len(store))]
+        return routes, {"has dst": has_dst, "no dst": no_dst}
+
+    def save_routes(self, path : str, store : RouteStore, info):
+        stat = os.stat(path)
+        def write(file):
+            file.write(struct.pack(PathCache.ROUTES, PathCache.MAGIC,
+                                   stat.st_size, stat.st_mtime_ns,
+                                   info["has dst"], info["no dst"]))
+            store.dump(file)
+        self.write(self.entry(path), write)
+
+    def fingerprint(self, paths : list[str]) -> bytes:
+        return fingerprint(paths, str(self.lazy))
+
+    def load_zones(self, paths : list[str]):
+        '''
+            Return the remap zones of every sample of the folder, as lists
+            of (real, i1, j1, i2, j2), or None if any file has changed.
+        '''
+        buffer = PathCache.read(f"{self.dir}/samples.zones")
+        if buffer is None:
+            return None
+        with buffer:
+            magic, fingerprint = struct.unpack_from(PathCache.ZONES, buffer)
+            if (magic, fingerprint) != (PathCache.MAGIC, self.fingerprint(paths)):
+                return None
+            offsets, offset = read_column(buffer, struct.calcsize(PathCache.ZONES))
+            values, _ = read_column(buffer, offset)
+        zones = []
+        for a, b in zip(offsets, offsets[1:]):
+            zones.append([tuple(values[i:i+5]) for i in range(5*a, 5*b, 5)])
+        return zones
+
+    def save_zones(self, paths : list[str], samples):
+        # 5 values per zone, and the offset of the zones of each sample
+        offsets = array('I', [0])
+        values = array('i')
+        for sample in samples:
+            for real, lcz in sample.lczs:
+                values.extend((real, lcz.i1, lcz.j1, lcz.i2, lcz.j2))
+            offsets.append(len(values) // 5)
+        def write(file):
+            file.write(struct.pack(PathCache.ZONES, PathCache.MAGIC,
+                                   self.fingerprint(paths)))
+            write_column(file, offsets)
+            write_column(file, values)
+        self.write(f"{self.dir}/samples.zones", write)
@@ -0,0 +1,89 @@
+import json
+import os
+import time
+
+import tables
+
+
+class Checkpoint:
+    '''
+        Progress of a simulate run, saved as JSON with its tables. It
+        records the last remap (sample_id, zone_id, ttl) whose result
+        was handled, the last zone and sample rows written, the rows
+        and bytes of each table file and the counters of the run.
+
+        It is keyed to the fingerprint of the paths folder and of the
+        options picking the remaps, so a run is only resumed on the same
+        remaps.
+    '''
+    def __init__(self, path : str, fingerprint : str, every : float = 300.0):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.every = every
+        self.saved = time.monotonic()
+        # Progress of this run
+        self.job = (-1, -1, -1)
+        self.zone = (-1, -1)
+        self.sample = -1
+        # Progress of the run resumed, skipped by this one
+        self.done = (self.job, self.zone, self.sample)
+        self.tables = None
+        self.counts = None
+
+    def load(self) -> bool:
+        '''
+            Resume from the checkpoint file, returning False if there is
+            none. Raise ValueError if it was saved for other paths.
+        '''
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return False
+        if state["fingerprint"] != self.fingerprint:
+            raise ValueError(f"{self.path} was saved for other paths or options")
+        self.job = tuple(state["job"])
+        self.zone = tuple(state["zone"])
+        self.sample = state["sample"]
+        self.done = (self.job, self.zone, self.sample)
+        self.tables = {name: tuple(value) for name, value in state["tables"].items()}
+        self.counts = state["counts"]
+        return True
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def due(self) -> bool:
+        return time.monotonic() - self.saved >= self.every
+
+    def save(self, counts):
+        '''
+            Write the rows kept by the tables and the progress, replacing
+            the checkpoint file at once.
+        '''
+        state = {
+            "fingerprint": self.fingerprint,
+            "job": self.job,
+            "zone": self.zone,
+            "sample": self.sample,
+            "tables": tables.checkpoint(),
+            "counts": counts
+        }
+        with open(f"{self.path}.tmp", "w") as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+        self.saved = time.monotonic()
+
+    def job_done(self, key : tuple[int, int, int]) -> bool:
+        return key <= self.done[0]
+
+    def zone_done(self, key : tuple[int, int]) -> bool:
+        return key <= self.done[1]
+
+    def sample_done(self, sample_id : int) -> bool:
+        return sample_id <= self.done[2]
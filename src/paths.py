@@ -1,7 +1,15 @@
 from collections import defaultdict
 from enum import Enum
 from route import *
+from cache import PathCache
+from store import RouteStore, ip2int
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import itertools
 import os
+import tempfile
+import zlib
 
 class LCZ:
     def __init__(self,
@@ -31,6 +39,25 @@ class Sample(list):
         self.old_route = old_route
         self.new_route = new_route
         self.lczs = self.find_remap_zones(old_route,new_route)
+
+    @staticmethod
+    def restore(old_route : Route,
+                new_route : Route,
+                zones : list[tuple]):
+        '''
+            Sample with remap zones computed before, as (real, i1, j1,
+            i2, j2) tuples, skipping the route difference.
+        '''
+        sample = Sample.__new__(Sample)
+        sample.old_route = old_route
+        sample.new_route = new_route
+        sample.lczs = [(real, RouteChange.restore(old_route, new_route, i1, i2, j1, j2))
+                       for real, i1, j1, i2, j2 in zones]
+        return sample
+
+    def pack(self):
+        self.old_route.pack()
+        self.new_route.pack()
         
     @staticmethod
     def find_remap_zones(old_route, new_route):
@@ -54,6 +81,24 @@ class Sample(list):
 
         return remap_zones
 
+    @staticmethod
+    def remap_zones(changes : list[tuple]) -> list[tuple]:
+        '''
+            find_remap_zones() for changes given as (i1, j1, i2, j2),
+            returning the zones as (real, i1, j1, i2, j2).
+        '''
+        remap_zones = []
+        offset = 0
+
+        for i, (i1, j1, i2, j2) in enumerate(changes):
+            offset += j2 - j1
+            remap_zones.append((1, i1, j1, i2, j2))
+            if i < len(changes)-1 and offset != 0:
+                next_i1, _, next_i2, _ = changes[i+1]
+                remap_zones.append((0, j1, next_i1, j2, next_i2))
+
+        return remap_zones
+
 class PathManager:
     multiple_change_zone = 0
     info = defaultdict(lambda : 0)
@@ -81,9 +126,11 @@ class PathManager:
         return path_hops
     
     @staticmethod
-    def build_route(data : str | list[str]) -> Route:
+    def build_route(data : str | list[str],
+                    store : RouteStore | None = None,
+                    lazy : bool = False) -> Route:
         if isinstance(data, str): data = data.split()
-        route = Route(' '.join(data[1:]))
+        route = Route(' '.join(data[1:]), store = store, lazy = lazy)
         route.metadata.nprobes = int(data[0])
         return route
     
@@ -91,48 +138,403 @@ class PathManager:
 
     def hop_equal(a : Hop,
                   b : Hop):
-        a_ifset = set([iface.ip for iface in a])
-        b_ifset = set([iface.ip for iface in b])
-        return len(a_ifset.intersection(b_ifset)) > 0
+        return not a.keyset.isdisjoint(b.keyset)
+
+    @staticmethod
+    def read_lines(folder):
+        for path_file in sorted(os.listdir(folder)):
+            with open(f"{folder}/{path_file}", "r") as content:
+                yield from content
+
+    @staticmethod
+    def line_key(line : str) -> tuple[int, int, int]:
+        '''
+            Return (src, dst, tstamp) of a measure line without parsing
+            its hops. Lines may carry the 4 metadata fields after nprobes.
+        '''
+        fields = line.split(maxsplit = 8)
+        offset = 5 if len(fields) == 9 else 1
+        src, dst, tstamp = fields[offset:offset+3]
+        return ip2int(src), ip2int(dst), int(tstamp)
+
+    @staticmethod
+    def read_route(line : str,
+                   store : RouteStore | None = None,
+                   lazy : bool = False) -> Route | None:
+        '''
+            Build the route of a measure line with the source as its
+            first hop. Return None if it does not reach the destination.
+        '''
+        route = PathManager.build_route(line, store, lazy)
+
+        src_hopstr = Hop.STARSTR.split(':')
+        src_hopstr[0] = str(route.src)
+        src_hopstr = ':'.join(src_hopstr)
+        route.hops.insert(0,Hop(0,src_hopstr))
+
+        if route.dst in route:
+            route.pack()
+            return route
+        return None
+
+    @staticmethod
+    def read_routes(lines, store, lazy, info) -> list[Route]:
+        routes = []
+        for line in lines:
+            route = PathManager.read_route(line, store, lazy)
+            if route is None:
+                info["no dst"] += 1
+                continue
+            info["has dst"] += 1
+            routes.append(route)
+        return routes
+
+    @staticmethod
+    def read_file(path : str,
+                  lazy : bool = False,
+                  cache : PathCache | None = None):
+        if cache is not None:
+            cached = cache.load_routes(path)
+            if cached is not None:
+                return cached
+
+        info = Counter()
+        store = RouteStore(lazy)
+        with open(path, "r") as content:
+            routes = PathManager.read_routes(content, store, lazy, info)
+
+        if cache is not None:
+            cache.save_routes(path, store, info)
+        return routes, info
+
+    @staticmethod
+    def read_groups(groups : list[list[str]], lazy : bool = False):
+        info = Counter()
+        samples = []
+        for lines in groups:
+            routes = PathManager.read_routes(lines, RouteStore(lazy), lazy, info)
+            samples.extend(PathManager.group_samples(routes, info))
+        return samples, info
+
+    @staticmethod
+    def chunk_samples(chunk):
+        store, groups, batch = chunk
+        groups = [[Route.view(store, rid) for rid in rids] for rids in groups]
+        info = Counter()
+        if batch:
+            return PathManager.batch_samples(groups, info), info
+        samples = []
+        for routes in groups:
+            samples.extend(PathManager.group_samples(routes, info))
+        return samples, info
+
+    @staticmethod
+    def restore_samples(groups, zones) -> list[Sample] | None:
+        '''
+            Samples of the groups with cached zones, or None if the zones
+            do not match the number of samples.
+        '''
+        if sum(max(len(group) - 1, 0) for group in groups) != len(zones):
+            return None
+        samples = []
+        for group in groups:
+            group.sort(key = lambda route : route.tstamp)
+            for old_route, new_route in zip(group, group[1:]):
+                samples.append(Sample.restore(old_route, new_route, zones[len(samples)]))
+        return samples
+
+    @staticmethod
+    def shard(route : Route, count : int) -> int:
+        '''
+            Shard of the (src, dst) group of a route among `count`
+            shards, the same on every host.
+        '''
+        return zlib.crc32(f"{route.src} {route.dst}".encode()) % count
+
+    @staticmethod
+    def add_info(info):
+        for key, value in info.items():
+            PathManager.info[key] += value
+
+    @staticmethod
+    def unchanged(old_route : Route,
+                  new_route : Route) -> list[tuple] | None:
+        '''
+            Return the hop keys of two routes with the same hops, without
+            unpacking them, or None if their digests or keys differ.
+        '''
+        if old_route.hop_digest() != new_route.hop_digest():
+            return None
+        keys = old_route.hop_keys()
+        return keys if keys == new_route.hop_keys() else None
 
     @staticmethod
-    def explore(folder):
+    def group_samples(group : list[Route], info = None) -> list[Sample]:
+        '''
+            Samples of the time adjacent routes of a group. Routes with
+            the same hops as the one before give a sample without remap
+            zones, skipping the route difference, counted as "unchanged
+            pairs" in `info`.
+        '''
+        info = PathManager.info if info is None else info
+        group.sort(key = lambda route : route.tstamp)
+        samples = []
+        for old_route, new_route in zip(group, group[1:]):
+            keys = PathManager.unchanged(old_route, new_route)
+            if keys is None:
+                samples.append(Sample(old_route, new_route))
+                continue
+            # What Route.diff leaves in the routes
+            PathManager.check_reachability(old_route, keys)
+            PathManager.check_reachability(new_route, keys)
+            samples.append(Sample.restore(old_route, new_route, []))
+            info["unchanged pairs"] += 1
+        for route in group:
+            route.pack()
+        return samples
+
+    @staticmethod
+    def batch_samples(groups : list[list[Route]], info = None) -> list[Sample]:
+        '''
+            group_samples() for many groups at once, with the differences
+            of all their samples computed together by batchdiff. Pairs
+            with the same hops are left out of the batch.
+        '''
+        import batchdiff
+
+        info = PathManager.info if info is None else info
+        pairs = []
+        group_keys = []
+        unchanged = []
+        for group in groups:
+            group.sort(key = lambda route : route.tstamp)
+            keys = [route.hop_keys() for route in group]
+            group_keys.append(keys)
+            for old, new in zip(keys, keys[1:]):
+                unchanged.append(old == new)
+                if not unchanged[-1]:
+                    pairs.append((old, new))
+        info["unchanged pairs"] += sum(unchanged)
+
+        changes = iter(batchdiff.batch_diff(pairs))
+        unchanged = iter(unchanged)
+        samples = []
+        for group, keys in zip(groups, group_keys):
+            for old_route, new_route in zip(group, group[1:]):
+                zones = [] if next(unchanged) else Sample.remap_zones(next(changes))
+                samples.append(Sample.restore(old_route, new_route, zones))
+            for route, route_keys in zip(group, keys):
+                if len(group) > 1:
+                    PathManager.check_reachability(route, route_keys)
+                route.pack()
+        return samples
+
+    @staticmethod
+    def check_reachability(route : Route, keys : list[tuple]):
+        '''
+            Route.check_reachability(), given the hop keys of the route,
+            unpacking it only if its flag is out of date. Routes have no
+            trailing stars to drop, Route() already dropped them.
+        '''
+        # The flag is up to date when it is set exactly on the routes
+        # whose last hop does not have the destination
+        unreachable = not keys or int(route.dst) not in keys[-1]
+        if unreachable != (Route.Flag.DEST_UNREACHABLE in route.flags):
+            route.check_reachability()
+
+    @staticmethod
+    def explore(folder,
+                lazy : bool = False,
+                jobs : int = 1,
+                cache : bool = False,
+                batch : bool = False):
         def group_id(route : Route):
             return f"{route.src} {route.dst}"
 
+        # Sorted, so samples are numbered the same on every host
+        paths = [f"{folder}/{path_file}" for path_file in sorted(os.listdir(folder))]
+        path_cache = PathCache(folder, lazy) if cache else None
+        if jobs > 1:
+            return PathManager.explore_parallel(paths, lazy, jobs, path_cache, batch)
+
         routes = []
         groups = defaultdict(lambda : [])
         samples = []
 
         # Getting routes from path measures
-        for path_file in os.listdir(folder):
-            content = open(f"{folder}/{path_file}", "r")
-            for line in content:
-                route = PathManager.build_route(line)
-                
-                src_hopstr = Hop.STARSTR.split(':')
-                src_hopstr[0] = str(route.src)
-                src_hopstr = ':'.join(src_hopstr)
-                route.hops.insert(0,Hop(0,src_hopstr))
-
-                if route.dst in route:
-                    routes.append(route)
-                    PathManager.info["has dst"] += 1
-                else:
-                    PathManager.info["no dst"] += 1
-
-            content.close()
+        for path in paths:
+            file_routes, info = PathManager.read_file(path, lazy, path_cache)
+            routes.extend(file_routes)
+            PathManager.add_info(info)
         
         # Grouping routes by source and destination
         for route in routes:
             id = group_id(route)
             groups[id].append(route)
+
+        if path_cache is not None:
+            zones = path_cache.load_zones(paths)
+            if zones is not None:
+                cached = PathManager.restore_samples(groups.values(), zones)
+                if cached is not None: return cached
         
         # Getting and filtering samples of time adjcent routes
-        for id in groups:
-            if not len(groups[id]): continue
-            groups[id].sort(key = lambda route : route.tstamp)
-            for route_pair in zip(groups[id], groups[id][1:]):
-                samples.append(Sample(*route_pair))
+        if batch:
+            samples = PathManager.batch_samples(list(groups.values()))
+        else:
+            for id in groups:
+                if not len(groups[id]): continue
+                samples.extend(PathManager.group_samples(groups[id]))
+
+        if path_cache is not None:
+            path_cache.save_zones(paths, samples)
+        return samples
+
+    @staticmethod
+    def explore_parallel(paths : list[str],
+                         lazy : bool,
+                         jobs : int,
+                         path_cache : PathCache | None = None,
+                         batch : bool = False):
+        '''
+            explore() with files parsed and groups turned into samples
+            by `jobs` processes. Groups are split into contiguous chunks
+            and merged back in order, so samples (and their ids) come in
+            the same order as in the serial version.
+        '''
+        routes = []
+        groups = defaultdict(lambda : [])
+        samples = []
+
+        with ProcessPoolExecutor(jobs) as executor:
+            results = executor.map(PathManager.read_file, paths,
+                                   itertools.repeat(lazy),
+                                   itertools.repeat(path_cache))
+            for file_routes, info in results:
+                routes.extend(file_routes)
+                PathManager.add_info(info)
+
+            for route in routes:
+                groups[route.src, route.dst].append(route)
+
+            if path_cache is not None:
+                zones = path_cache.load_zones(paths)
+                if zones is not None:
+                    cached = PathManager.restore_samples(groups.values(), zones)
+                    if cached is not None: return cached
 
+            # Chunks of about the same number of routes, each copied into
+            # its own store so only its records are sent to the worker
+            size = len(routes) // (4 * jobs) + 1
+            chunks = []
+            store, rids, count = None, [], size
+            for group in groups.values():
+                if count >= size:
+                    store, rids, count = RouteStore(lazy), [], 0
+                    chunks.append((store, rids, batch))
+                rids.append([store.copy(route.store, route.rid) for route in group])
+                count += len(group)
+            del routes, groups
+
+            for chunk, info in executor.map(PathManager.chunk_samples, chunks):
+                samples.extend(chunk)
+                PathManager.add_info(info)
+
+        if path_cache is not None:
+            path_cache.save_zones(paths, samples)
         return samples
+
+    @staticmethod
+    def is_grouped(folder) -> bool:
+        '''
+            Check if the measures of each (src, dst) pair are contiguous
+            in the folder, reading only the first fields of each line.
+        '''
+        seen = set()
+        last = None
+        for line in PathManager.read_lines(folder):
+            pair = PathManager.line_key(line)[:2]
+            if pair == last: continue
+            if pair in seen: return False
+            seen.add(pair)
+            last = pair
+        return True
+
+    @staticmethod
+    def sorted_lines(folder, chunk : int = 100000):
+        '''
+            External sort of the folder lines by (src, dst, tstamp): runs
+            of `chunk` lines are sorted into temporary files and merged.
+        '''
+        runs = []
+        lines = []
+
+        def flush():
+            lines.sort(key = PathManager.line_key)
+            run = tempfile.TemporaryFile("w+")
+            run.writelines(lines)
+            run.seek(0)
+            runs.append(run)
+            lines.clear()
+
+        for line in PathManager.read_lines(folder):
+            lines.append(line if line.endswith("\n") else line + "\n")
+            if len(lines) >= chunk: flush()
+        if lines: flush()
+
+        try: yield from heapq.merge(*runs, key = PathManager.line_key)
+        finally:
+            for run in runs: run.close()
+
+    @staticmethod
+    def stream(folder, lazy : bool = False, chunk : int = 100000, jobs : int = 1):
+        '''
+            Generator version of explore(), yielding the samples of one
+            (src, dst) group at a time, each group with its own store.
+            If the measures of a pair are spread over the folder, lines
+            are sorted on disk first and groups come in (src, dst) order.
+        '''
+        lines = PathManager.read_lines(folder)
+        if not PathManager.is_grouped(folder):
+            lines = PathManager.sorted_lines(folder, chunk)
+
+        pair = lambda line : PathManager.line_key(line)[:2]
+        groups = (list(group) for _, group in itertools.groupby(lines, pair))
+        if jobs > 1:
+            yield from PathManager.stream_parallel(groups, lazy, jobs)
+            return
+
+        for group in groups:
+            store = RouteStore(lazy)
+            routes = PathManager.read_routes(group, store, lazy, PathManager.info)
+            yield from PathManager.group_samples(routes)
+
+    @staticmethod
+    def stream_parallel(groups, lazy : bool, jobs : int, batch : int = 1000):
+        '''
+            Hand batches of about `batch` lines to `jobs` processes, with
+            at most two batches per process in flight, and yield their
+            samples in order.
+        '''
+        def batches():
+            tasks, count = [], 0
+            for group in groups:
+                tasks.append(group)
+                count += len(group)
+                if count >= batch:
+                    yield tasks
+                    tasks, count = [], 0
+            if tasks: yield tasks
+
+        with ProcessPoolExecutor(jobs) as executor:
+            pending = deque()
+            for tasks in batches():
+                pending.append(executor.submit(PathManager.read_groups, tasks, lazy))
+                if len(pending) < 2 * jobs: continue
+                samples, info = pending.popleft().result()
+                PathManager.add_info(info)
+                yield from samples
+            while pending:
+                samples, info = pending.popleft().result()
+                PathManager.add_info(info)
+                yield from samples
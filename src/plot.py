@@ -1,12 +1,19 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.dates
-
 colors=["blue","green","red","black","purple","orange","brown"]
 
-matplotlib.rcParams['pdf.fonttype'] = 42
-matplotlib.rcParams['ps.fonttype'] = 42
+# ------------------------------------------------------- #
+def pyplot():
+    '''
+        matplotlib.pyplot, imported on the first graph plotted, as it
+        takes most of the start up time of stats.py.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.dates
+
+    matplotlib.rcParams['pdf.fonttype'] = 42
+    matplotlib.rcParams['ps.fonttype'] = 42
+    return matplotlib, plt
 
 # ------------------------------------------------------- #
 def plot_graph(points, logx=False, logy=False, xlabel="xlabel",\
@@ -14,6 +21,7 @@ def plot_graph(points, logx=False, logy=False, xlabel="xlabel",\
                vlines=[], xnorm=1, xmin=0, xmax=None, vpos=0.5, ymax=1,
                legend=True, rotatex=None, isdate=False, xticks=[],
                xticks_label=[]):
+    matplotlib, plt = pyplot()
 
     plt.figure(figsize=(8,6))
 
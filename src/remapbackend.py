@@ -0,0 +1,118 @@
+from abc import ABC, abstractmethod
+import os
+import subprocess
+import threading
+import time
+
+import remapworker
+from remapcache import file_digest
+from remapworker import RemapJob, WorkerClient, command, emulate
+
+# Modules the outputs of emulate() come from
+EMULATOR_SOURCES = ("remapworker.py", "remapper.py", "paths.py", "route.py", "store.py")
+
+
+def emulator_digest() -> str:
+    folder = os.path.dirname(os.path.abspath(remapworker.__file__))
+    return file_digest(*(os.path.join(folder, name) for name in EMULATOR_SOURCES))
+
+
+class Backend(ABC):
+    '''
+        Runs remap jobs, returning the output remaproute prints for each.
+        `run` is called from the threads of Remapper.map and must not
+        read routes, which the calling thread packs as samples finish:
+        what it needs from the sample is taken by `prepare`, called in
+        the calling thread before the job is submitted.
+    '''
+    def __init__(self, exec : str, iface : str, log : str):
+        self.exec = exec
+        self.iface = iface
+        self.log = log
+
+    def command(self, job : RemapJob) -> list[str]:
+        return ["sudo"] + command(self.exec, self.iface, self.log, job)
+
+    def prepare(self, job : RemapJob, sample):
+        '''
+            What run() needs from the routes of `sample`, given to it
+            in place of the sample.
+        '''
+        return None
+
+    @abstractmethod
+    def run(self, job : RemapJob, prepared) -> str:
+        '''
+            Output of `job`, with what prepare() returned for it.
+        '''
+
+    def digest(self) -> str:
+        '''
+            Identity of the outputs of the backend, for RemapCache.
+            Raises OSError if it can not be read.
+        '''
+        return file_digest(self.exec)
+
+    def close(self):
+        pass
+
+
+class ProcessBackend(Backend):
+    '''
+        remaproute started with sudo for each job.
+    '''
+    def run(self, job : RemapJob, prepared) -> str:
+        process = subprocess.run(self.command(job), stdout = subprocess.PIPE)
+        return process.stdout.decode().rstrip()
+
+
+class WorkerBackend(Backend):
+    '''
+        Jobs sent to a long-lived worker, running remaproute or the
+        stand-in. The worker is started with the first job.
+    '''
+    def __init__(self, exec : str, iface : str, log : str,
+                 standin : bool = False, concurrency : int = 1):
+        super().__init__(exec, iface, log)
+        self.standin = standin
+        self.concurrency = concurrency
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def run(self, job : RemapJob, prepared) -> str:
+        with self.lock:
+            if self.worker is None:
+                self.worker = WorkerClient.start(self.exec, self.iface, self.log,
+                                                 self.standin, self.concurrency)
+        return self.worker.run(job)
+
+    def digest(self) -> str:
+        if self.standin:
+            return emulator_digest()
+        return super().digest()
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.close()
+
+
+class EmulatorBackend(Backend):
+    '''
+        Outputs of the expected solution, computed in the calling thread
+        by prepare() and returned by run() after `latency` seconds.
+    '''
+    def __init__(self, exec : str, iface : str, log : str, latency : float = 0.0):
+        super().__init__(exec, iface, log)
+        self.latency = latency
+
+    def prepare(self, job : RemapJob, sample) -> str:
+        return emulate(job, sample, self.latency)
+
+    def run(self, job : RemapJob, prepared : str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return prepared
+
+    def digest(self) -> str:
+        return f"{emulator_digest()} latency {self.latency}"
+
@@ -0,0 +1,113 @@
+import hashlib
+import sqlite3
+import threading
+
+from remapworker import RemapJob
+
+
+def file_digest(*paths : str) -> str:
+    '''
+        Hash of the contents of files. Raises OSError if one can not be
+        read, as outputs keyed without it could not be told apart.
+    '''
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            digest.update(hashlib.file_digest(file, "sha256").digest())
+    return digest.hexdigest()
+
+
+class RemapCache:
+    '''
+        SQLite store of remap outputs keyed by the remaproute arguments
+        (-d, -o, -n, -t, -x) and the digest of the backend that answered
+        them (Backend.digest), the hash of the remaproute binary or of
+        the modules the stand-in and the emulator answer from.
+
+        Modes:
+            record        run every remap and store its output
+            replay        only answer from the store, without running
+                          anything; remaps not stored have no output
+            read-through  answer from the store, running and storing
+                          the remaps not found
+    '''
+    MODES = ("record", "replay", "read-through")
+
+    def __init__(self, path : str, binary : str, mode : str = "read-through"):
+        assert mode in RemapCache.MODES
+        self.mode = mode
+        self.binary = binary
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS remap (
+                binary TEXT, dst TEXT, old TEXT, new TEXT, ttl INTEGER, x INTEGER,
+                output TEXT,
+                PRIMARY KEY (binary, dst, old, new, ttl, x)
+            )""")
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def select(self, job : RemapJob) -> str | None:
+        # Called with the lock held
+        row = self.db.execute(
+            "SELECT output FROM remap WHERE binary = ? AND dst = ? AND old = ?"
+            " AND new = ? AND ttl = ? AND x = ?",
+            (self.binary, *job)).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, job : RemapJob) -> str | None:
+        with self.lock:
+            return self.select(job)
+
+    @staticmethod
+    def complete(output : str) -> bool:
+        '''
+            Whether an output is a result line of remaproute: nprobes, src,
+            dst, tstamp, hops, measures and latency. Empty or cut outputs,
+            from a crash, a sudo failure or a timeout, are not stored, so
+            a later run tries them again.
+        '''
+        fields = output.split()
+        if len(fields) != 7:
+            return False
+        try:
+            int(fields[0]), int(fields[5]), float(fields[6])
+        except ValueError:
+            return False
+        return True
+
+    def put(self, job : RemapJob, output : str):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO remap VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (self.binary, *job, output))
+            self.db.commit()
+
+    def run(self, job : RemapJob, run) -> str:
+        '''
+            Output of `job`, from the store or from `run` as the mode
+            says.
+        '''
+        if self.mode != "record":
+            # Counted under the lock, as jobs run in the Remapper.map threads
+            with self.lock:
+                output = self.select(job)
+                if output is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            if output is not None:
+                return output
+            if self.mode == "replay":
+                return ""
+        output = run(job)
+        if RemapCache.complete(output):
+            self.put(job, output)
+        return output
+
+    def close(self):
+        with self.lock:
+            self.db.close()
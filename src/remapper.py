@@ -1,8 +1,23 @@
 from __future__ import annotations
 from route import *
-import subprocess
 from paths import PathManager
+from remapworker import RemapJob
+from remapbackend import Backend
+from remapcache import RemapCache
 from enum import Enum
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import dataclasses
+
+@dataclasses.dataclass
+class RemapResult:
+    sample : PathManager.Sample
+    ttl : int
+    cmd : list[str]
+    output : str
+    result : Route | None
+    status : Remapper.Status
+    data : str
 
 class Remapper:
     class Status(Enum):
@@ -13,59 +28,106 @@ class Remapper:
         ERROR = "Unexpected behavior"
         NO_REMAP = "No remap to do"
 
-    @classmethod
-    def config(cls, 
-               exec : str, 
-               iface : str, 
-               log : str):
-        cls.exec = exec
-        cls.iface = iface
-        cls.log = log
-
-    @classmethod
-    def remap(cls, 
+    def __init__(self,
+                 backend : Backend,
+                 cache : RemapCache | None = None):
+        '''
+            Remaps are run by `backend`. With a `cache`, outputs are
+            looked up and stored there as its mode says.
+        '''
+        self.backend = backend
+        self.cache = cache
+
+    @staticmethod
+    def job(sample : PathManager.Sample,
+            ttl : int) -> RemapJob:
+        return RemapJob(str(sample.new_route.dst),
+                        PathManager.hopstr(sample.old_route),
+                        PathManager.hopstr(sample.new_route),
+                        ttl)
+
+    def run(self, job : RemapJob, prepared) -> str:
+        '''
+            Output of a job, with what Backend.prepare() took from its
+            sample. Called from the threads of map(), so routes are not
+            read here.
+        '''
+        if self.cache is not None:
+            return self.cache.run(job, lambda job : self.backend.run(job, prepared))
+        return self.backend.run(job, prepared)
+
+    def close(self):
+        self.backend.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def remap(self,
               sample : PathManager.Sample,
-              ttl : int) -> Route | None:
-        cls.sample = sample
-        cls.ttl = ttl
-        
-        cmd = [
-            "sudo", cls.exec, 
-            "-i", cls.iface,
-            "-l", cls.log,
-            "-x", str(10),
-            "-d", str(sample.new_route.dst),
-            "-o", PathManager.hopstr(sample.old_route),
-            "-n", PathManager.hopstr(sample.new_route),
-            "-t", str(ttl)
-        ]
-        process = subprocess.run(cmd, stdout = subprocess.PIPE)
-        output : str = process.stdout.decode().rstrip()
+              ttl : int) -> RemapResult:
+        job = Remapper.job(sample, ttl)
+        prepared = self.backend.prepare(job, sample)
+        return self.result(sample, ttl, self.backend.command(job), self.run(job, prepared))
+
+    def result(self,
+               sample : PathManager.Sample,
+               ttl : int,
+               cmd : list[str],
+               output : str) -> RemapResult:
+        '''
+            Parse the output of a remap and check it against the
+            expected solution.
+        '''
         result : Route | None = None
+        status = Remapper.Status.ERROR
+
+        try:
+            result = PathManager.build_route(output.split()[0:5], lazy = True)
+        except Exception:
+            pass
+        else:
+            cmd = cmd + ["OUTPUT :", str(result)]
+            status = Remapper.validate_result(sample, ttl, result)
+
+        data = '\n'.join(map(
+            lambda p : f"{p[0]} '{p[1]}'",
+            zip(cmd[0::2], cmd[1::2])
+        ))
+        return RemapResult(sample, ttl, cmd, output, result, status, data)
+
+    def map(self, jobs, workers : int = 1):
+        '''
+            Remap the (key, sample, ttl) jobs with up to `workers`
+            remaps running at once, yielding (key, RemapResult) in the
+            order of the jobs. Only the processes run in other threads,
+            routes are read and parsed in the calling one.
+        '''
+        with ThreadPoolExecutor(workers) as executor:
+            pending = deque()
+
+            def done():
+                key, sample, ttl, cmd, future = pending.popleft()
+                return key, self.result(sample, ttl, cmd, future.result())
+
+            for key, sample, ttl in jobs:
+                job = Remapper.job(sample, ttl)
+                prepared = self.backend.prepare(job, sample)
+                pending.append((key, sample, ttl, self.backend.command(job),
+                                executor.submit(self.run, job, prepared)))
+                if len(pending) >= 2 * workers:
+                    yield done()
+            while pending:
+                yield done()
 
-        try: 
-            result = PathManager.build_route(output.split()[0:5])
-        except Exception as exception:
-            cls.status = Remapper.Status.ERROR
-        else: 
-            cmd += ["OUTPUT :", str(result)]
-            cls.result = result
-            cls.output = output
-            cls.validate_result()
-        finally:
-            cls.data = '\n'.join(map(
-                lambda p : f"{p[0]} '{p[1]}'",
-                zip(cmd[0::2], cmd[1::2])
-            ))
-
-        return cmd,output,result
-    
     @staticmethod
     def expected_solution(sample : PathManager.Sample,
-                          ttl : int) -> tuple[list[Hop], Remapper.Status]:
+                          ttl : int) -> tuple[list[Hop] | None, Remapper.Status]:
+        '''
+            Route remaproute should find remapping up to `ttl`, None
+            with Status.ERROR if no real zone starts before it.
+        '''
         old_hops = sample.old_route.hops
         new_hops = sample.new_route.hops
-        expected : list[Hop]
+        expected : list[Hop] | None
         status = Remapper.Status.OK_SINGLE
 
         ttl -= 1
@@ -79,7 +141,7 @@ class Remapper:
                 expected = sample.old_route.hops.copy()
                 status = Remapper.Status.NO_REMAP
         else:
-            last_lcz : RouteChange
+            last_lcz : RouteChange | None = None
             i = 0
             for real,lcz in sample.lczs:
                 if not real: continue
@@ -87,6 +149,9 @@ class Remapper:
                 if lcz.i2 >= ttl: break
                 last_lcz = lcz
 
+            if last_lcz is None:
+                return None, Remapper.Status.ERROR
+
             expected = new_hops[:last_lcz.j2+1] + old_hops[last_lcz.j1+1:]
 
             # Cutting after 4 consecutive star detections
@@ -94,22 +159,24 @@ class Remapper:
             if star_count >= 4: status = Remapper.Status.UNRESPONSIVE
 
         return expected,status
-    
-    @classmethod
-    def validate_result(cls) -> Remapper.Status:
-        expected, status = cls.expected_solution(cls.sample, cls.ttl)
+
+    @staticmethod
+    def validate_result(sample : PathManager.Sample,
+                        ttl : int,
+                        result : Route) -> Remapper.Status:
+        expected, status = Remapper.expected_solution(sample, ttl)
+        if expected is None:
+            return status
         equal : bool = True
 
-        if len(cls.result) != len(expected):
+        if len(result) != len(expected):
             equal = False
         else:
             for i in range(len(expected)):
-                if not Hop.equal(cls.result.hops[i], expected[i], 
+                if not Hop.equal(result.hops[i], expected[i],
                              frozenset([RouteDifferenceOption.IGNORE_BALANCERS])):
                     equal = False
                     break
-        
-        if not equal: cls.status = Remapper.Status.DIFFERENT
-        else: cls.status = status
 
-        return cls.status
+        if not equal: return Remapper.Status.DIFFERENT
+        return status
@@ -0,0 +1,184 @@
+'''
+    Long-lived remap worker. One worker per interface reads remap jobs
+    from its standard input and writes their results to its standard
+    output, one JSON object per line:
+
+        {"id": 1, "dst": "...", "old": "...", "new": "...", "ttl": 5, "x": 10}
+        {"id": 1, "output": "..."}
+
+    Results are written as jobs finish, not in order. The worker runs
+    the remaproute binary for each job, or with --standin answers them
+    with the expected solution, so the protocol can be used without
+    root or network. Run as
+
+        sudo python3 src/remapworker.py -i <iface> -l <log> --exec <remaproute>
+        python3 src/remapworker.py --standin
+'''
+from concurrent.futures import Future, ThreadPoolExecutor
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import traceback
+from typing import NamedTuple
+
+# Probes sent for each hop remapped by the stand-in
+PROBES_PER_HOP = 6
+
+
+class RemapJob(NamedTuple):
+    dst : str
+    old : str
+    new : str
+    ttl : int
+    x : int = 10
+
+
+def command(exec : str, iface : str, log : str, job : RemapJob) -> list[str]:
+    return [
+        exec,
+        "-i", iface,
+        "-l", log,
+        "-x", str(job.x),
+        "-d", job.dst,
+        "-o", job.old,
+        "-n", job.new,
+        "-t", str(job.ttl)
+    ]
+
+
+def emulate(job : RemapJob, sample = None, latency : float = 0.0) -> str:
+    '''
+        Output remaproute would print if the route found was the
+        expected solution of the remap. The sample is built from the
+        job when not given.
+    '''
+    from paths import Sample
+    from remapper import Remapper
+    from route import Route, SEPARATOR_HOP
+
+    src = job.new.split(":", 1)[0]
+    if sample is None:
+        old = Route(f"{src} {job.dst} 0 {job.old}")
+        new = Route(f"{src} {job.dst} 0 {job.new}")
+        sample = Sample(old, new)
+    expected, _ = Remapper.expected_solution(sample, job.ttl)
+    if expected is None:
+        # remaproute's output would not parse either
+        return ""
+    hops = SEPARATOR_HOP.join(str(hop) for hop in expected)
+    measures = max(len(expected) - job.ttl + 1, 1)
+    return f"{PROBES_PER_HOP * measures} {src} {job.dst} 0 {hops} {measures} {latency * 1000:.1f}"
+
+
+def serve(run, concurrency : int = 1, jobs = sys.stdin, results = sys.stdout):
+    '''
+        Answer the jobs read from `jobs` with `run`, running up to
+        `concurrency` of them at once.
+    '''
+    lock = threading.Lock()
+
+    def answer(message):
+        # Every job is answered, the client waits for its id
+        try:
+            output = run(RemapJob(message["dst"], message["old"], message["new"],
+                                  message["ttl"], message.get("x", 10)))
+        except Exception:
+            traceback.print_exc(file = sys.stderr)
+            output = ""
+        with lock:
+            results.write(json.dumps({"id": message["id"], "output": output}) + "\n")
+            results.flush()
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        for line in jobs:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                message["id"]
+            except (ValueError, KeyError, TypeError):
+                print(f"Invalid job {line.strip()!r}", file = sys.stderr)
+                continue
+            executor.submit(answer, message)
+
+
+class WorkerClient:
+    '''
+        Worker process started with `cmd`, with one future per job
+        resolved by a thread reading its results.
+    '''
+    def __init__(self, cmd : list[str]):
+        self.process = subprocess.Popen(cmd, stdin = subprocess.PIPE,
+                                        stdout = subprocess.PIPE, text = True)
+        self.ids = itertools.count()
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.reader = threading.Thread(target = self.read, daemon = True)
+        self.reader.start()
+
+    @staticmethod
+    def start(exec : str, iface : str, log : str,
+              standin : bool = False, concurrency : int = 1):
+        worker = [sys.executable, os.path.abspath(__file__), "-c", str(concurrency)]
+        if standin:
+            return WorkerClient(worker + ["--standin"])
+        return WorkerClient(["sudo"] + worker + ["--exec", exec, "-i", iface, "-l", log])
+
+    def submit(self, job : RemapJob) -> Future:
+        future = Future()
+        message = dict(job._asdict())
+        with self.lock:
+            message["id"] = next(self.ids)
+            self.pending[message["id"]] = future
+            try:
+                self.process.stdin.write(json.dumps(message) + "\n")
+                self.process.stdin.flush()
+            except OSError:
+                # The worker exited
+                del self.pending[message["id"]]
+                future.set_result("")
+        return future
+
+    def run(self, job : RemapJob) -> str:
+        return self.submit(job).result()
+
+    def read(self):
+        for line in self.process.stdout:
+            message = json.loads(line)
+            with self.lock:
+                future = self.pending.pop(message["id"])
+            future.set_result(message["output"])
+        # The worker exited, jobs left have no output
+        with self.lock:
+            for future in self.pending.values():
+                future.set_result("")
+            self.pending.clear()
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+        self.reader.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = 'Remap Worker')
+    parser.add_argument("-i", "--iface")
+    parser.add_argument("-l", "--log_file", default = "/dev/null")
+    parser.add_argument("--exec", help = "remaproute binary")
+    parser.add_argument("--standin", action = "store_true",
+                        help = "answer with the expected solution instead of probing")
+    parser.add_argument("-c", "--concurrency", type = int, default = 1)
+    args = parser.parse_args()
+
+    if args.standin:
+        run = emulate
+    else:
+        def run(job):
+            cmd = command(args.exec, args.iface, args.log_file, job)
+            process = subprocess.run(cmd, stdout = subprocess.PIPE)
+            return process.stdout.decode().rstrip()
+    serve(run, args.concurrency)
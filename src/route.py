@@ -1,10 +1,13 @@
-from collections import defaultdict
+from array import array
+from collections import OrderedDict, defaultdict
+import bisect
 import dataclasses
 import enum
 import functools
 import ipaddress
+import threading
 from datetime import datetime
-from aslookup import get_as_data
+from store import STAR_ID, STAR_INT, RouteStore, address, hop_digest, hop_key, ip2int
 
 
 SEPARATOR_HOP = "|"
@@ -12,6 +15,7 @@ SEPARATOR_IFACE = ";"
 SEPARATOR_IF_FIELD = ":"
 SEPARATOR_INNER = ","
 STAR = ipaddress.IPv4Address("255.255.255.255")
+STAR_KEY = (STAR_ID,)
 
 
 class RouteDifferenceOption(enum.Enum):
@@ -23,7 +27,7 @@ class RouteDifferenceOption(enum.Enum):
 #ALL_DIFFERENCE_OPTIONS = frozenset(RouteDifferenceOption)
 ALL_DIFFERENCE_OPTIONS = frozenset(set(["fix_unresponsive","fill_missing_hops"]))
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class RouteMetadata:
     class RouteMeasurementTool(enum.Enum):
         PARISTR = "paristr"
@@ -82,35 +86,157 @@ class Route:
         DEST_UNREACHABLE = "dest_unreachable"
         HAD_LOOP = "had_loop"
 
-    def __init__(self, line, initial_ttl=0, end_ttl= 100, ignore_prefixes=[], latency = 0):
-        self.line = line
+    FLAGS = list(Flag)
+    TOOLS = list(RouteMetadata.RouteMeasurementTool)
+
+    # Changes and copied hops found by compare(), the least recently
+    # used dropped first, shared by the threads diffing routes
+    MEMO_SIZE = 1 << 9
+    memo = OrderedDict()
+    memo_lock = threading.Lock()
+
+    __slots__ = ("metadata", "src", "dst", "tstamp", "flags", "store", "rid",
+                 "_pristine", "_hops", "ip2iface", "latency")
+
+    def __init__(self, line, initial_ttl=0, end_ttl= 100, ignore_prefixes=[], latency = 0,
+                 store : RouteStore | None = None, lazy = False):
         self.metadata = RouteMetadata()
         fields = line.split()
         if len(fields) == 8:
             self.metadata = RouteMetadata.parse_line(line)
             fields = fields[4:]
         src, dst, tstamp, hopsstr = fields
-        self.src = ipaddress.IPv4Address(src)
-        self.dst = ipaddress.IPv4Address(dst)
+        self.src = address(ip2int(src))
+        self.dst = address(ip2int(dst))
         self.tstamp = int(tstamp)
         self.flags = set()
+        # Routes attached to a store keep their hops there after pack(),
+        # and only rebuild the Hop objects when they are accessed.
+        self.store = store
+        self.rid = None
+        self._pristine = ()
         self.hops = list()
         self.ip2iface = dict()
         self.latency = latency
         i = 0
         for hopstr in hopsstr.split("|")[initial_ttl:end_ttl]:
-            self[i] = Hop(i, hopstr)
+            self[i] = Hop(i, hopstr, lazy)
             i += 1
         self.remove_loops()
         self.check_reachability()
         # self.ases = None
         # self.compute_as_info()
 
+    @property
+    def hops(self):
+        if self._hops is None:
+            self._hops = self._unpack()
+        return self._hops
+
+    @hops.setter
+    def hops(self, hops):
+        self._hops = hops
+
+    @staticmethod
+    def view(store : RouteStore, rid : int):
+        '''
+            Route over an existing store record, without hop objects.
+        '''
+        route = Route.__new__(Route)
+        route.store = store
+        route.rid = rid
+        route.src = address(store.src[rid])
+        route.dst = address(store.dst[rid])
+        route.tstamp = store.tstamp[rid]
+        route.metadata = RouteMetadata(store.nprobes[rid],
+                                       store.request_tstamp[rid],
+                                       store.logging_tstamp[rid],
+                                       Route.TOOLS[store.tool[rid]])
+        route.flags = set(flag for i, flag in enumerate(Route.FLAGS)
+                          if store.flags[rid] >> i & 1)
+        route.latency = 0
+        route._hops = None
+        route._pristine = ()
+        route.ip2iface = None
+        return route
+
+    def _unpack(self):
+        store = self.store
+        hops = list()
+        self.ip2iface = dict()
+        build = Interface.unparsed if store.lazy else Interface.build
+        for h in store.hop_range(self.rid):
+            ttl = store.ttl[h]
+            ifaces = [build(ttl, *store.interface(i))
+                      for i in store.iface_range(h)]
+            hop = Hop.build(ttl, ifaces)
+            for iface in hop:
+                self.ip2iface[iface.ip] = iface
+            hops.append(hop)
+        self._pristine = tuple(hops)
+        return hops
+
+    def _modified(self):
+        if len(self._hops) != len(self._pristine):
+            return True
+        return any(a is not b for a, b in zip(self._hops, self._pristine))
+
+    def pack(self):
+        '''
+            Move the hops into the route store and drop the Hop and
+            Interface objects until they are accessed again. Routes
+            without a store are left untouched. Modified routes are
+            written over their record when it fits them, else appended
+            again (see RouteStore).
+        '''
+        if self.store is None or self._hops is None:
+            return
+        if self.rid is None or self._modified():
+            metadata = (self.metadata.nprobes,
+                        self.metadata.request_tstamp,
+                        self.metadata.logging_tstamp,
+                        Route.TOOLS.index(self.metadata.measurement_tool))
+            if self.store.lazy:
+                fields = lambda iface : (int(iface.ip), iface.fields())
+            else:
+                fields = lambda iface : (int(iface.ip), iface.flowids,
+                                         iface.rttdata(), iface.flags)
+            hops = [(hop.ttl, [fields(iface) for iface in hop])
+                    for hop in self._hops]
+            if self.rid is None or not self.store.replace(self.rid, hops):
+                if self.rid is not None:
+                    self.store.dead += 1
+                self.rid = self.store.append(int(self.src), int(self.dst), self.tstamp,
+                                             metadata, 0, hops)
+        self.store.flags[self.rid] = sum(1 << Route.FLAGS.index(flag) for flag in self.flags)
+        self._hops = None
+        self._pristine = ()
+        self.ip2iface = None
+
     def __str__(self):
         metastr = "" if not self.metadata else f"{self.metadata} "
         hopstr = SEPARATOR_HOP.join(str(hop) for hop in self.hops)
         return f"{metastr}{self.src} {self.dst} {self.tstamp} {hopstr}"
 
+    def hop_keys(self):
+        '''
+            The interface IPs of each hop as a tuple of integers, read
+            from the store when the hops are not unpacked.
+        '''
+        if self._hops is None:
+            return self.store.hop_keys(self.rid)
+        return [tuple(int(iface.ip) for iface in hop) for hop in self._hops]
+
+    def hop_digest(self) -> int:
+        '''
+            store.hop_digest() of the hops, kept in the store since the
+            route was parsed while they are not changed.
+        '''
+        if self.rid is not None and (self._hops is None or not self._modified()):
+            return self.store.digest[self.rid]
+        keys = self.hop_keys()
+        return hop_digest(array('I', (ip for key in keys for ip in key)), len(keys))
+
     def ip_path_list(self):
         ip_list = []
         for hop in self.hops:
@@ -148,9 +274,15 @@ class Route:
             self.ip2iface[iface.ip] = iface
 
     def __len__(self):
-        return len(self.hops)
+        if self._hops is None:
+            return self.store.hop_count(self.rid)
+        return len(self._hops)
 
     def __contains__(self, ip):
+        if self._hops is None:
+            if not isinstance(ip, ipaddress.IPv4Address):
+                return False
+            return self.store.contains(self.rid, int(ip))
         return ip in self.ip2iface
 
     def __iter__(self):
@@ -174,67 +306,143 @@ class Route:
 
     @staticmethod
     def diff(r1, r2, options=ALL_DIFFERENCE_OPTIONS):
+        '''
+            Changes between r1 and r2. Unlike compare(), the routes are
+            left with the hops fixed and filled, and without trailing stars.
+        '''
+        changes, hops1, hops2 = Route.compare(r1, r2, options)
+        r1.repair(hops1)
+        r2.repair(hops2)
+        r1.check_reachability()
+        r2.check_reachability()
+        # r1.compute_as_info()
+        # r2.compute_as_info()
+
+        return [RouteChange.restore(r1, r2, i1, i2, j1, j2)
+                for i1, j1, i2, j2 in changes]
+
+    @staticmethod
+    def compare(r1, r2, options=ALL_DIFFERENCE_OPTIONS):
+        '''
+            Route.diff without changing the routes. Return the changes as
+            the (i1, j1, i2, j2) kept by RouteChange, and the hops of both
+            routes as diff() leaves them. Results are memoized by the
+            fingerprint of both routes, and the hops built again from
+            the routes given on a hit.
+        '''
+        key = (r1.fingerprint(), r2.fingerprint(), options)
+        with Route.memo_lock:
+            found = Route.memo.get(key)
+            if found is not None:
+                Route.memo.move_to_end(key)
+        if found is not None:
+            return Route.replay(r1, r2, *found)
+        changes, copies, hops1, hops2 = Route._compare(r1, r2, options)
+        with Route.memo_lock:
+            Route.memo[key] = (changes, copies)
+            if len(Route.memo) > Route.MEMO_SIZE:
+                Route.memo.popitem(last=False)
+        return changes, hops1, hops2
+
+    @staticmethod
+    def replay(r1, r2, changes, copies):
+        '''
+            compare() of r1 and r2 from the changes and the copies of
+            hops, as (target, ttl, source, position), that _compare()
+            found for routes with the same fingerprints.
+        '''
+        hops = (list(r1.hops), list(r2.hops))
+        for target, ttl, source, position in copies:
+            hop = Hop.copy(hops[source][position])
+            hop.ttl = ttl
+            if ttl == len(hops[target]):
+                hops[target].append(hop)
+            else:
+                hops[target][ttl] = hop
+        Route.trim(hops)
+        return changes, tuple(hops[0]), tuple(hops[1])
+
+    @staticmethod
+    def trim(hops):
+        # As check_reachability() leaves them
+        for route_hops in hops:
+            while route_hops and route_hops[-1].star():
+                route_hops.pop()
+
+    @staticmethod
+    def _compare(r1, r2, options):
         # pylint: disable=R0912,too-many-statements
 
-        def _join(r1, r2, i1, i2, options):
+        def _join(i1, i2, options):
+            nonlocal index
+            # First hop of r2 (not a star) found in r1 from i1 on, looked
+            # up in the index of r1 instead of rescanning it for each hop
+            j1 = len(hops1)
             j2 = i2
-            while j2 < len(r2):
-                if r2[j2].star():
+            while j2 < len(hops2):
+                if hops2[j2].star():
                     j2 += 1
                     continue
-                j1 = i1
-                while j1 < len(r1):
-                    if Hop.equal(r1[j1], r2[j2], options):
-                        return j1, j2
-                    j1 += 1
+                if index is None:
+                    index = HopIndex(hops1, options)
+                j1 = index.find(hops2[j2], i1)
+                if j1 is not None:
+                    return j1, j2
                 j2 += 1
 
             assert (RouteDifferenceOption.IGNORE_BALANCERS not in options) or (
                 Route.Flag.DEST_UNREACHABLE in r1.flags
                 or Route.Flag.DEST_UNREACHABLE in r2.flags
-            ), f"{r1} {r1.flags}\n{r2} {r2.flags}\n{i1} {j1} {len(r1)} {i2} {j2} {len(r2)}\n{r1[i1]}"
+            ), f"{r1} {r1.flags}\n{r2} {r2.flags}\n{i1} {j1} {len(hops1)} {i2} {j2} {len(hops2)}\n{hops1[i1]}"
 
-            return len(r1), len(r2)
+            return len(hops1), len(hops2)
 
-        def _fix(r1, r2, i1, i2, j1, j2):
-            def _fix1hop(r1, r2, i1, i2, j1, j2):
-                h1 = r1[i1]
-                h2 = r2[i2]
+        def _fix(i1, i2, j1, j2):
+            def _fix1hop(i1, i2, j1, j2):
+                h1 = hops1[i1]
+                h2 = hops2[i2]
                 if h1.star() and h2.star():
                     return True
                 if not h1.star() and not h2.star():
                     return False
 
-                if r1[i1].star():
-                    pstar = r1
+                if h1.star():
+                    pstar, phops, padded = r1, hops1, added1
                     istar = i1
                     jstar = j1
                     srchop = h2
+                    copy = (0, i1, 1, i2)
                 else:
-                    pstar = r2
+                    pstar, phops, padded = r2, hops2, added2
                     istar = i2
                     jstar = j2
                     srchop = h1
+                    copy = (1, i2, 0, i1)
 
                 # not fixing with load balancers:
                 #if len(srchop.ifaces) > 1:
                 #    return False
                 # not fixing with interface already in another hop:
-                if srchop.ifaces[0].ip in pstar:
+                ip = srchop.ifaces[0].ip
+                if ip in pstar or ip in padded:
                     return False
                 # not fixing with dst if it's not the last hop in the path:
-                if srchop.ifaces[0].ip == pstar.dst and istar + 1 != jstar:
+                if ip == pstar.dst and istar + 1 != jstar:
                     return False
 
                 hop = Hop.copy(srchop)
                 hop.ttl = istar
-                pstar[istar] = hop
+                if phops is hops1 and index is not None:
+                    index.replace(istar, h1, hop)
+                phops[istar] = hop
+                copies.append(copy)
+                padded.update(iface.ip for iface in hop)
                 return True
 
             i = 0
             thresh = min(j1 - i1, j2 - i2)
             while i < thresh:
-                if not _fix1hop(r1, r2, i1, i2, j1, j2):
+                if not _fix1hop(i1, i2, j1, j2):
                     break
                 i += 1
 
@@ -245,7 +453,7 @@ class Route:
             while i < thresh:
                 ttl1 = j1 - i - 1
                 ttl2 = j2 - i - 1
-                if not _fix1hop(r1, r2, ttl1, ttl2, j1, j2):
+                if not _fix1hop(ttl1, ttl2, j1, j2):
                     break
                 i += 1
             j1 -= i
@@ -254,51 +462,80 @@ class Route:
             assert i1 <= j1 and i2 <= j2
             return i1, i2, j1, j2
 
-        def _fill(r1, r2, ttl):
-            assert ttl == len(r1) or ttl == len(r2)
-            shorter, longer = (r1, r2) if len(r1) < len(r2) else (r2, r1)
+        def _fill(ttl):
+            assert ttl == len(hops1) or ttl == len(hops2)
+            shorter, longer = (hops1, hops2) if len(hops1) < len(hops2) else (hops2, hops1)
+            target = 0 if shorter is hops1 else 1
             while ttl < len(longer):
                 hop = Hop.copy(longer[ttl])
-                shorter[ttl] = hop
+                assert hop.ttl == ttl
+                shorter.append(hop)
+                copies.append((target, ttl, 1 - target, ttl))
                 ttl += 1
 
         assert r1.src == r2.src and r1.dst == r2.dst
+        # Stars are fixed and hops filled in copies of the hop lists,
+        # with the IPs they add to each route kept apart, and the copied
+        # hops kept for replay()
+        hops1, hops2 = list(r1.hops), list(r2.hops)
+        added1, added2 = set(), set()
+        copies = []
+        index = None
         i1 = 0
         i2 = 0
         changes = list()
-        while i1 < len(r1) and i2 < len(r2):
-            if Hop.equal(r1[i1], r2[i2], options):
+        while i1 < len(hops1) and i2 < len(hops2):
+            if Hop.equal(hops1[i1], hops2[i2], options):
                 i1 += 1
                 i2 += 1
                 continue
-            j1, j2 = _join(r1, r2, i1, i2, options)
-            assert j1 <= len(r1) and j2 <= len(r2)
+            j1, j2 = _join(i1, i2, options)
+            assert j1 <= len(hops1) and j2 <= len(hops2)
             if RouteDifferenceOption.FIX_UNRESPONSIVE in options:
-                i1, i2, j1, j2 = _fix(r1, r2, i1, i2, j1, j2)
+                i1, i2, j1, j2 = _fix(i1, i2, j1, j2)
             if j1 > i1 or j2 > i2:
-                changes.append(RouteChange(r1, r2, i1, i2, j1, j2))
+                RouteChange.check(hops1, hops2, i1, i2, j1, j2)
+                changes.append((i1 - 1, j1, i2 - 1, j2))
             i1 = j1
             i2 = j2
 
         if RouteDifferenceOption.FILL_MISSING_HOPS in options and not changes:
             assert i1 == i2
-            _fill(r1, r2, i1)
-        elif i1 != len(r1) or i2 != len(r2):
-            changes.append(RouteChange(r1, r2, i1, i2, len(r1), len(r2)))
-
-        r1.check_reachability()
-        r2.check_reachability()
-        # r1.compute_as_info()
-        # r2.compute_as_info()
-
-        return changes
+            _fill(i1)
+        elif i1 != len(hops1) or i2 != len(hops2):
+            RouteChange.check(hops1, hops2, i1, i2, len(hops1), len(hops2))
+            changes.append((i1 - 1, len(hops1), i2 - 1, len(hops2)))
+
+        Route.trim((hops1, hops2))
+        return tuple(changes), tuple(copies), tuple(hops1), tuple(hops2)
+
+    def fingerprint(self):
+        '''
+            Key of the route in the memo of compare(): the interned keys
+            of its hops, the same whether the route is packed or not, and
+            holding no reference to its hops or store.
+        '''
+        if self._hops is None:
+            keys = tuple(hop_key(ips)[0] for ips in self.store.hop_keys(self.rid))
+        else:
+            keys = tuple(hop.key for hop in self._hops)
+        return (self.src, self.dst, frozenset(self.flags), keys)
+
+    def repair(self, hops):
+        '''
+            Take the stars fixed and the hops filled by compare().
+        '''
+        current = self.hops
+        for i, hop in enumerate(hops):
+            if i == len(current) or (current[i] is not hop and current[i].star()):
+                self[i] = hop
 
     def __eq__(self, other):
         if not isinstance(other, Route):
             raise ValueError("can only compare Routes")
         if((self.src, self.dst) != (other.src, other.dst)):
             return False
-        if(not Route.diff(self, other)):
+        if(not Route.compare(self, other)[0]):
             return True
         return False
 
@@ -351,14 +588,28 @@ class Route:
 class Hop:
     STARSTR = "255.255.255.255:0:0.00,0.00,0.00,0.00:"
 
-    def __init__(self, ttl, hopstr):
+    # `key` and `keyset` hold the interned ids of the interface IPs,
+    # so hops are compared as integers
+    __slots__ = ("ttl", "ifaces", "ifset", "key", "keyset")
+
+    def __init__(self, ttl, hopstr, lazy=False):
         self.ttl = int(ttl)
         ifaces = list()
         for ifstr in hopstr.split(SEPARATOR_IFACE):
-            ifaces.append(Interface(ttl, ifstr))
+            ifaces.append(Interface(ttl, ifstr, lazy))
         ifaces.sort()
         self.ifaces = tuple(ifaces)
         self.ifset = frozenset(ifaces)
+        self.key, self.keyset = hop_key(int(iface.ip) for iface in ifaces)
+
+    def __getstate__(self):
+        return self.ttl, self.ifaces
+
+    def __setstate__(self, state):
+        # Ids are interned again, other processes number IPs differently
+        self.ttl, self.ifaces = state
+        self.ifset = frozenset(self.ifaces)
+        self.key, self.keyset = hop_key(int(iface.ip) for iface in self.ifaces)
 
     def __contains__(self, ip) -> bool:
         return bool(list(iface for iface in self.ifaces if iface == ip))
@@ -380,11 +631,15 @@ class Hop:
         return jsondict
 
     def star(self):
-        return len(self.ifaces) == 1 and self.ifaces[0] == STAR
+        return self.key == STAR_KEY
 
     def asn(self, asdb):
+        '''
+            Origin AS of the first interface that is not a star, from an
+            asmap.ASMap or an {ip: asn} mapping.
+        '''
         for iface in self.ifaces:
-            if(iface != STAR):
+            if(iface.ip != STAR):
                 return asdb[str(iface.ip)]
 
 
@@ -392,30 +647,108 @@ class Hop:
     def equal(h1, h2, options):
         #print(h1, h2)
         if RouteDifferenceOption.IGNORE_BALANCERS in options:
-            return h1.ifset.intersection(h2.ifset)
-        return h1.ifaces == h2.ifaces
+            return not h1.keyset.isdisjoint(h2.keyset)
+        return h1.key == h2.key
 
     @staticmethod
     def copy(hop):
         return Hop(hop.ttl, str(hop))
 
+    @staticmethod
+    def build(ttl, ifaces):
+        hop = Hop.__new__(Hop)
+        hop.ttl = ttl
+        ifaces.sort()
+        hop.ifaces = tuple(ifaces)
+        hop.ifset = frozenset(ifaces)
+        hop.key, hop.keyset = hop_key(int(iface.ip) for iface in ifaces)
+        return hop
+
+class HopIndex:
+    '''
+        Positions of the hops of a route by key, matching Hop.equal: the
+        whole interface tuple, or each interface if balancers are ignored.
+    '''
+    def __init__(self, hops, options):
+        self.balancers = RouteDifferenceOption.IGNORE_BALANCERS in options
+        self.positions = defaultdict(list)
+        for i, hop in enumerate(hops):
+            for key in self.keys(hop):
+                self.positions[key].append(i)
+
+    def keys(self, hop):
+        return hop.key if self.balancers else (hop.key,)
+
+    def find(self, hop, start):
+        '''
+            First position from `start` of a hop equal to `hop`, or None.
+        '''
+        found = None
+        for key in self.keys(hop):
+            positions = self.positions.get(key)
+            if not positions:
+                continue
+            k = bisect.bisect_left(positions, start)
+            if k < len(positions) and (found is None or positions[k] < found):
+                found = positions[k]
+        return found
+
+    def replace(self, i, old, new):
+        for key in self.keys(old):
+            positions = self.positions[key]
+            del positions[bisect.bisect_left(positions, i)]
+        for key in self.keys(new):
+            bisect.insort(self.positions[key], i)
+
+
 @functools.total_ordering
 class Interface:
-    def __init__(self, ttl, ifstr):
+    __slots__ = ("ttl", "ip", "_raw", "_flags", "_flowids", "_rtts")
+
+    def __init__(self, ttl, ifstr, lazy=False):
+        # Only the IP is decoded here. With `lazy`, flowids, RTTs and
+        # flags are kept as text until one of them is first accessed.
         self.ttl = int(ttl)
-        ip, flowids, rttdata, flags = ifstr.split(SEPARATOR_IF_FIELD)
+        ip, _, self._raw = ifstr.partition(SEPARATOR_IF_FIELD)
         if(ip == "*"):# or (ipaddress.IPv4Address(ip).is_private and ttl > 1)):
             ip = "255.255.255.255"
-        self.ip = ipaddress.IPv4Address(ip)
-        self.flags = flags
-        self.flowids = tuple(int(i) for i in flowids.split(SEPARATOR_INNER))
+        self.ip = address(ip2int(ip))
+        if not lazy:
+            self._decode()
+
+    def _decode(self):
+        flowids, rttdata, flags = self._raw.split(SEPARATOR_IF_FIELD)
+        self._flags = flags
+        self._flowids = tuple(int(i) for i in flowids.split(SEPARATOR_INNER))
         rttmin, rttavg, rttmax, rttvar = rttdata.split(SEPARATOR_INNER)
-        self.rttmin = float(rttmin)
-        self.rttavg = float(rttavg)
-        self.rttmax = float(rttmax)
-        self.rttvar = float(rttvar)
+        self._rtts = (float(rttmin), float(rttavg), float(rttmax), float(rttvar))
+        self._raw = None
+
+    @property
+    def flags(self):
+        if self._raw is not None:
+            self._decode()
+        return self._flags
+
+    @property
+    def flowids(self):
+        if self._raw is not None:
+            self._decode()
+        return self._flowids
+
+    def rttdata(self):
+        if self._raw is not None:
+            self._decode()
+        return self._rtts
+
+    rttmin = property(lambda self: self.rttdata()[0])
+    rttavg = property(lambda self: self.rttdata()[1])
+    rttmax = property(lambda self: self.rttdata()[2])
+    rttvar = property(lambda self: self.rttdata()[3])
 
     def __eq__(self, other):
+        if isinstance(other, Interface):
+            return self.ip == other.ip
         if isinstance(other, str):
             return self.ip == ipaddress.IPv4Address(other)
         if isinstance(other, ipaddress.IPv4Address):
@@ -425,6 +758,8 @@ class Interface:
         return self.ip == other.ip
 
     def __lt__(self, other):
+        if isinstance(other, Interface):
+            return self.ip < other.ip
         if isinstance(other, str):
             return self.ip < ipaddress.IPv4Address(other)
         if isinstance(other, ipaddress.IPv4Address):
@@ -436,18 +771,41 @@ class Interface:
     def __hash__(self):
         return hash(self.ip)
 
+    @staticmethod
+    def build(ttl, ip, flowids, rtts, flags):
+        iface = Interface.__new__(Interface)
+        iface.ttl = ttl
+        iface.ip = address(ip)
+        iface._raw = None
+        iface._flags = flags
+        iface._flowids = flowids
+        iface._rtts = rtts
+        return iface
+
+    @staticmethod
+    def unparsed(ttl, ip, raw):
+        iface = Interface.__new__(Interface)
+        iface.ttl = ttl
+        iface.ip = address(ip)
+        iface._raw = raw
+        return iface
+
+    def fields(self):
+        '''
+            Text after the IP, as found in the measurement file.
+        '''
+        if self._raw is not None:
+            return self._raw
+        return str(self).partition(SEPARATOR_IF_FIELD)[2]
+
     def __str__(self):
+        if self._raw is not None:
+            return f"{self.ip}{SEPARATOR_IF_FIELD}{self._raw}"
         flowids = SEPARATOR_INNER.join(str(i) for i in self.flowids)
-        if not hasattr(self, "rttavg"):
-            rttdata = "0.00,0.00,0.00,0.00"
-        else:
-            data = [self.rttmin, self.rttavg, self.rttmax, self.rttvar]
-            rttdata = SEPARATOR_INNER.join("%.2f" % x for x in data)
+        rttdata = SEPARATOR_INNER.join("%.2f" % x for x in self.rttdata())
         return SEPARATOR_IF_FIELD.join([str(self.ip), flowids, rttdata, self.flags])
 
     def ripe_json(self):
-        if not hasattr(self, "rttavg"):
-            return {"from": str(self.ip), "rtt": 0.0}
         return {"from": str(self.ip), "rtt": self.rttavg}
 
 
@@ -455,18 +813,7 @@ class RouteChange:
     def __init__(self, r1, r2, i1, i2, j1, j2):
         assert r1.src == r2.src and r1.dst == r2.dst
         #assert r2.tstamp >= r1.tstamp
-
-        assert (
-            i1 == 0
-            or i2 == 0
-            or Hop.equal(r1[i1 - 1], r2[i2 - 1], ALL_DIFFERENCE_OPTIONS)
-        ), f"{r1}\n{r1[i1 - 1]}\n{r2}\n{r2[i2 - 1]}"
-
-        assert (
-            j1 == len(r1)
-            or j2 == len(r2)
-            or Hop.equal(r1[j1], r2[j2], ALL_DIFFERENCE_OPTIONS)
-        ), f"{r1}\n{r1[j1]}\n{r2}\n{r2[j2]}"
+        RouteChange.check(r1, r2, i1, i2, j1, j2)
 
         self.r1 = r1
         self.r2 = r2
@@ -475,6 +822,41 @@ class RouteChange:
         self.j1 = j1
         self.j2 = j2
 
+    @staticmethod
+    def check(hops1, hops2, i1, i2, j1, j2):
+        '''
+            Assert that a change branches and joins at equal hops, given
+            two routes or their lists of hops.
+        '''
+        text = lambda hops : SEPARATOR_HOP.join(str(hop) for hop in hops)
+
+        assert (
+            i1 == 0
+            or i2 == 0
+            or Hop.equal(hops1[i1 - 1], hops2[i2 - 1], ALL_DIFFERENCE_OPTIONS)
+        ), f"{text(hops1)}\n{hops1[i1 - 1]}\n{text(hops2)}\n{hops2[i2 - 1]}"
+
+        assert (
+            j1 == len(hops1)
+            or j2 == len(hops2)
+            or Hop.equal(hops1[j1], hops2[j2], ALL_DIFFERENCE_OPTIONS)
+        ), f"{text(hops1)}\n{hops1[j1]}\n{text(hops2)}\n{hops2[j2]}"
+
+    @staticmethod
+    def restore(r1, r2, i1, i2, j1, j2):
+        '''
+            RouteChange with indexes as stored in a RouteChange, without
+            checking them against the routes.
+        '''
+        change = RouteChange.__new__(RouteChange)
+        change.r1 = r1
+        change.r2 = r2
+        change.i1 = i1
+        change.i2 = i2
+        change.j1 = j1
+        change.j2 = j2
+        return change
+
     def __hash__(self):
         return hash((self.r1.src, self.r1.dst, self.r2.tstamp))
 
@@ -499,12 +881,66 @@ class RouteChange:
 
 
 class RouteMapper:
+    '''
+        The last route of each (src, dst), and an inverted index from the
+        IP of every interface, and the destination, to the routes that
+        cross it. Routes get integer ids in the order they are added, so
+        the routes of an IP are kept as a sorted array('I') of ids that
+        add() appends to and remove() bisects. Queries on several IPs
+        intersect their arrays from the shortest one.
+
+        Ids of removed routes are dropped once they are half of the ids,
+        renumbering the others in order, so ids are only valid until the
+        next remove().
+    '''
+    # Removed routes kept at least before renumbering
+    COMPACT = 1024
+
     def __init__(self):
-        self.ip2routes = defaultdict(set)
+        self.ip2routes = dict()
         self.srcdst2route = dict()
+        # By id, None once removed, with the IPs the route was indexed on
+        self.routes = list()
+        self.route_ips = list()
+        self.ids = dict()
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.routes) - self.removed
+
+    @staticmethod
+    def key(ip) -> int:
+        return ip2int(ip) if isinstance(ip, str) else int(ip)
+
+    def route_ids(self, ip) -> array:
+        '''
+            Sorted ids of the routes crossing `ip`, as text, int or
+            IPv4Address. The array is the index itself, not a copy.
+        '''
+        return self.ip2routes.get(RouteMapper.key(ip), array('I'))
 
     def get_ip_routes(self, ip):
-        return self.ip2routes[ip]
+        return [self.routes[rid] for rid in self.route_ids(ip)]
+
+    def crossing_ids(self, *ips) -> array:
+        '''
+            Sorted ids of the routes crossing every IP of `ips`.
+        '''
+        import numpy as np
+
+        postings = sorted((self.route_ids(ip) for ip in ips), key = len)
+        if not postings or not postings[0]:
+            return array('I')
+        found = np.frombuffer(postings[0], dtype = np.uint32)
+        for ids in postings[1:]:
+            ids = np.frombuffer(ids, dtype = np.uint32)
+            found = found[ids[np.minimum(np.searchsorted(ids, found), len(ids) - 1)] == found]
+            if not len(found):
+                break
+        return array('I', found.tobytes())
+
+    def crossing(self, *ips):
+        return [self.routes[rid] for rid in self.crossing_ids(*ips)]
 
     def get_old_route(self, rt):
         return self.srcdst2route[rt.src, rt.dst]
@@ -512,18 +948,60 @@ class RouteMapper:
     def get_old_route_srcdst(self, srcdst):
         return self.srcdst2route[srcdst]
 
-    def add(self, rt):
-        for hop in rt:
-            self.ip2routes[hop.ifaces[0].ip].add(rt)
-        self.ip2routes[rt.dst].add(rt)
+    def add(self, rt) -> int:
+        '''
+            Index a route and return its id. Adding a route again, after
+            its hops changed, indexes it on its new IPs.
+        '''
+        if id(rt) in self.ids:
+            self.remove(rt)
+        rid = len(self.routes)
+        ips = set(ip for key in rt.hop_keys() for ip in key)
+        ips.add(int(rt.dst))
+        ips.discard(STAR_INT)
+        ips = array('I', sorted(ips))
+        for ip in ips:
+            ids = self.ip2routes.get(ip)
+            if ids is None:
+                ids = self.ip2routes[ip] = array('I')
+            ids.append(rid)
+        self.routes.append(rt)
+        self.route_ips.append(ips)
+        self.ids[id(rt)] = rid
         self.srcdst2route[rt.src, rt.dst] = rt
+        return rid
 
     def remove(self, rt):
-        for hop in rt:
-            self.ip2routes[hop.ifaces[0].ip].discard(rt)
-        self.ip2routes[rt.dst].discard(rt)
-        del self.srcdst2route[rt.src, rt.dst]
-
+        rid = self.ids.pop(id(rt))
+        for ip in self.route_ips[rid]:
+            ids = self.ip2routes[ip]
+            del ids[bisect.bisect_left(ids, rid)]
+            if not ids:
+                del self.ip2routes[ip]
+        self.routes[rid] = self.route_ips[rid] = None
+        self.removed += 1
+        if self.srcdst2route.get((rt.src, rt.dst)) is rt:
+            del self.srcdst2route[rt.src, rt.dst]
+        if self.removed >= max(RouteMapper.COMPACT, len(self.routes) // 2):
+            self.compact()
+
+    def compact(self):
+        '''
+            Drop the ids of removed routes, renumbering the others in the
+            same order so the arrays stay sorted.
+        '''
+        renumber = array('I', bytes(4 * len(self.routes)))
+        kept = 0
+        for rid, rt in enumerate(self.routes):
+            if rt is not None:
+                renumber[rid] = kept
+                kept += 1
+        for ip, ids in self.ip2routes.items():
+            self.ip2routes[ip] = array('I', [renumber[rid] for rid in ids])
+        self.routes = [rt for rt in self.routes if rt is not None]
+        self.route_ips = [ips for ips in self.route_ips if ips is not None]
+        self.ids = {id(rt): rid for rid, rt in enumerate(self.routes)}
+        self.removed = 0
 
 def test():
 
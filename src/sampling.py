@@ -0,0 +1,42 @@
+import math
+import random
+
+
+class TTLSampler:
+    '''
+        Picks the TTLs remapped in each zone. A rate below 1 is the
+        fraction of the TTLs of the zone, from 1 on their count, with
+        at least one TTL kept per zone. Helper zones have their own rate.
+
+        Each zone is sampled on its own, so zones are strata nested in
+        their type (real or helper) and path length, and the rows of a
+        zone are weighted by TTLs / TTLs picked. Picks are seeded by the
+        sample and zone, so a resumed run picks the same TTLs.
+    '''
+    def __init__(self,
+                 rate : float | None = None,
+                 helper_rate : float | None = None,
+                 seed : int = 0):
+        self.rate = rate
+        self.helper_rate = rate if helper_rate is None else helper_rate
+        self.seed = seed
+
+    def __str__(self):
+        return f"{self.rate} {self.helper_rate} {self.seed}"
+
+    def pick(self,
+             sample_id : int,
+             index : int,
+             real : bool,
+             ttls : range) -> tuple[list[int], float]:
+        '''
+            TTLs picked among `ttls` of the zone at `index` of the
+            sample, and the weight of their rows.
+        '''
+        rate = self.rate if real else self.helper_rate
+        if rate is None or not ttls:
+            return list(ttls), 1.0
+        count = math.ceil(rate * len(ttls)) if rate < 1 else int(rate)
+        count = min(max(count, 1), len(ttls))
+        rand = random.Random(f"{self.seed} {sample_id} {index}")
+        return sorted(rand.sample(ttls, count)), len(ttls) / count
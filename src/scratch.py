@@ -1,3 +1,5 @@
+import numpy as np
+
 # ---------------------------------------------- #
 def transform_interval(intersect):
     if(intersect <= 0.0):
@@ -18,37 +20,46 @@ def transform_interval(intersect):
     return "none"
 
 # --------------------------------------------- #
-def gen_cdf_list(elements):
-
-    cdf = list()
-
-    total = len(elements)
-    keys = list(set(elements))
-    keys.sort()
-    acc = 0
-
-    for key in keys:
-        acc += elements.count(key)
-        cdf.append((key, acc/float(total)))
-
-    return cdf
+def gen_cdf_list(elements, points=None):
+    '''
+        ECDF of a list, array or Series as (key, fraction) pairs, at
+        most about `points` of them if given (see downsample_cdf).
+    '''
+    keys, counts = np.unique(np.asarray(elements), return_counts=True)
+    fractions = np.cumsum(counts) / counts.sum()
+    return cdf_pairs(keys, fractions, points)
 
 # --------------------------------------------- #
-def gen_cdf_dict(elements):
+def gen_cdf_dict(elements, points=None):
+    '''
+        gen_cdf_list() of the keys of a dict, each counted as many
+        times as its value.
+    '''
+    if not elements:
+        return []
+    keys = np.array(list(elements.keys()))
+    weights = np.array(list(elements.values()), dtype=float)
+    order = np.argsort(keys, kind="stable")
+    acc = np.cumsum(weights[order])
+    return cdf_pairs(keys[order], acc / acc[-1], points)
 
-    cdf = list()
-
-    keys = list(elements.keys())
-    keys.sort()
-
-    # Get total
-    total = 0
-    for key in keys:
-        total += elements[key]
-
-    acc = 0
-    for key in keys:
-        acc += elements[key]
-        cdf.append((key, acc/float(total)))
+# --------------------------------------------- #
+def cdf_pairs(keys, fractions, points=None):
+    if points:
+        keys, fractions = downsample_cdf(keys, fractions, points)
+    return list(zip(keys.tolist(), fractions.tolist()))
 
-    return cdf
\ No newline at end of file
+# --------------------------------------------- #
+def downsample_cdf(keys, fractions, points):
+    '''
+        Keep the first and last steps of an ECDF, and the first step
+        reaching each multiple of 1/points. Drawn as steps, the curve
+        is off by less than 1/points between the steps kept.
+    '''
+    if len(keys) <= points:
+        return keys, fractions
+    grid = np.arange(1, points) / points
+    keep = np.unique(np.concatenate((
+        [0], np.searchsorted(fractions, grid), [len(fractions) - 1])))
+    keep = keep[keep < len(fractions)]
+    return keys[keep], fractions[keep]
\ No newline at end of file
@@ -1,120 +1,232 @@
-# Pip libs
-from tqdm import tqdm
-from collections import defaultdict
+from collections import defaultdict, deque
 import os
+import sys
+import time
 
 # Local libs
 from remapper import *
 import arg_parser
+from remapbackend import EmulatorBackend, ProcessBackend, WorkerBackend
 import tables
+from cache import fingerprint
+from checkpoint import Checkpoint
 from paths import PathManager
+from sampling import TTLSampler
 
 def print_route(route):
     base = str(route)
     print(base.split()[-1].replace('|', '\n'))
 
-# Data and config
-args = arg_parser.get_args()
-log = open(args.log_file, "w+")
-samples = PathManager.explore(args.path_folder)
-
-Remapper.config('/home/giancarlo/remaprt/src/remaproute',
-                iface = args.iface,
-                log = args.log_file)
-
-print("Routes")
-for key,value in PathManager.info.items():
-    print("\t",key,value)
+def print_info():
+    print("Routes")
+    for key,value in PathManager.info.items():
+        print("\t",key,value)
 
 status_count = defaultdict(lambda : 0)
+sample_count = [0]
 lcz_count_data = [0,0]
 
+def is_twisted(sample) -> bool:
+    # Checking the relative order of hops
+    counter = 0
+    index = dict()  
+    for jhop in sample.new_route:
+        if not jhop in sample.old_route: continue
+        index[jhop] = (counter := counter+1)
+    counter = 0
+    for i in range(len(sample.old_route)):
+        if not sample.old_route[i] in index: continue
+        if index[sample.old_route[i]] < counter: 
+            return True
+        counter = index[sample.old_route[i]]
+    return False
+
+def counts():
+    return {"status": {status.name: count for status, count in status_count.items()},
+            "more probes": PathManager.info["more probes"],
+            "less probes": PathManager.info["less probes"]}
+
+def restore_counts(counts):
+    for name, count in counts["status"].items():
+        status_count[Remapper.Status[name]] = count
+    PathManager.info["more probes"] = counts["more probes"]
+    PathManager.info["less probes"] = counts["less probes"]
+
+def remap_jobs(samples, total, done, checkpoint, sampler, shard):
+    '''
+        Yield ((sample_id, zone_id, weight), sample, ttl) for every TTL
+        picked by `sampler` to remap, writing the zone and sample rows
+        as samples are read. Samples go to `done` once all their jobs
+        were yielded. Jobs and rows of the run resumed by `checkpoint`
+        are skipped, and so are the samples of other shards.
+    '''
+    from tqdm import tqdm
+
+    for sample_id, sample in tqdm(enumerate(samples), total = total):
+        if shard is not None:
+            shard_index, shard_count = shard
+            if PathManager.shard(sample.new_route, shard_count) != shard_index - 1: continue
+        zone_id = 0
+        for index, (is_real,zone) in enumerate(sample.lczs):
+            ttls, weight = sampler.pick(sample_id, index, is_real,
+                                        range(zone.i2+is_real+1, zone.j2+1))
+            for ttl in ttls:
+                if not checkpoint.job_done((sample_id, zone_id, ttl)):
+                    yield (sample_id, zone_id, weight), sample, ttl
+            if is_real:
+                if not checkpoint.zone_done((sample_id, zone_id)):
+                    tables.add_row('zone', [sample_id, zone_id, zone.j1 - zone.i2, zone.j2 - zone.i2])
+                    checkpoint.zone = (sample_id, zone_id)
+                zone_id += 1
+
+        done.append((sample_id, sample))
+        if checkpoint.sample_done(sample_id): continue
+        tables.add_row('sample', [sample_id, len(sample.old_route),
+                                  len(sample.new_route), 
+                                  len(sample.lczs) > 0, 
+                                  is_twisted(sample)])
+        checkpoint.sample = sample_id
+        sample_count[0] += 1
+
 # Proccess
 if __name__ == "__main__":
-    for sample_id, sample in tqdm(enumerate(samples), total = len(samples)):
+    if sys.argv[1:2] == ["merge"]:
+        args = arg_parser.get_merge_args(sys.argv[2:])
         try:
-            twist = False
-            zone_id = 0
-
-            for is_real,zone in sample.lczs:
-                for pos in range(zone.i2+is_real, zone.j2):
-                    cmd,output,result = Remapper.remap(sample, pos+1)
-                    
-                    status_count[Remapper.status] += 1
-
-                    if Remapper.status == Remapper.Status.ERROR:
-                        log.write("Remap error\n")
-                        log.write(Remapper.data + "\n\n")
-                        continue
-                    
-                    #if Remapper.status == Remapper.Status.DIFFERENT:
-                    #    expected = '|'.join([str(hop) for hop in Remapper.expected_solution(sample, pos+1)[0]])
-                    #    log.write("Unexpected result\n")
-                    #    log.write(Remapper.data + "\n")
-                    #    log.write("EXPECTED " + expected + '\n')
-                    #    log.write("GIVEN " + str(result) + '\n')
-                    #    log.write("\n")
-                    #    continue
-                    
-                    data = Remapper.output.split()
-                    
-                    if sample.new_route.metadata.nprobes < int(data[0]):
-                        PathManager.info["more probes"] += 1
-                    else:
-                        PathManager.info["less probes"] += 1
-                    
-
-                    if sample.new_route.metadata.nprobes < int(data[0]):
-                        log.write("So much probes\n")
-                        log.write(Remapper.data + "\n\n")
-                        log.write(f"{sample.old_route.metadata.nprobes} {int(data[0])}")
-                        continue
-                    
-                    tables.add_row('detection', [sample_id, zone_id,
-                                                 pos+1, int(data[-2]), int(data[0]),
-                                                 sample.old_route.metadata.nprobes,
-                                                 float(data[-1]),
-                                                 Remapper.status == Remapper.Status.OK_MULTIPLE,
-                                                 Remapper.status == Remapper.Status.UNRESPONSIVE, 
-                                                 Remapper.status == Remapper.Status.NO_REMAP])
-                    
-                    #assert int(data[-1]) > 0
-                    
-                if is_real:
-                    tables.add_row('zone', [sample_id, zone_id, zone.j1 - zone.i2, zone.j2 - zone.i2])
-                    zone_id += 1
-        
-         
-            # Checking the relative order of hops
-            counter = 0
-            index = dict()  
-            for jhop in sample.new_route:
-                if not jhop in sample.old_route: continue
-                index[jhop] = (counter := counter+1)
-            counter = 0
-            for i in range(len(sample.old_route)):
-                if not sample.old_route[i] in index: continue
-                if index[sample.old_route[i]] < counter: 
-                    twist = True
-                    break
-                counter = index[sample.old_route[i]]
-
-            tables.add_row('sample', [sample_id, len(sample.old_route),
-                                      len(sample.new_route), 
-                                      len(sample.lczs) > 0, 
-                                      twist])
-        except KeyboardInterrupt:
-            print(status_count)
-            tables.save('out/tables')
-            exit(0)
-    
-    # Saving tables
-    try: os.mkdir('out/tables')
-    except: pass
-    finally:
+            tables.merge(args.shards, args.output)
+        except ValueError as error:
+            sys.exit(str(error))
+        exit(0)
+
+    # Data and config
+    args = arg_parser.get_args()
+    log = open(args.log_file, "w+")
+    if args.stream:
+        samples = PathManager.stream(args.path_folder, args.lazy, jobs = args.jobs)
+    else:
+        samples = PathManager.explore(args.path_folder, args.lazy, args.jobs,
+                                      args.cache, args.batch)
+
+    remaproute = '/home/giancarlo/remaprt/src/remaproute'
+    if args.backend == "process":
+        backend = ProcessBackend(remaproute, args.iface, args.log_file)
+    elif args.backend == "emulator":
+        backend = EmulatorBackend(remaproute, args.iface, args.log_file, args.latency)
+    else:
+        backend = WorkerBackend(remaproute, args.iface, args.log_file,
+                                standin = args.backend == "standin",
+                                concurrency = args.concurrency)
+    cache = None
+    if args.remap_cache:
+        try:
+            digest = backend.digest()
+        except OSError as error:
+            sys.exit(f"Can not hash {error.filename} to key the remap cache: {error.strerror}")
+        cache = RemapCache(args.remap_cache, digest, args.remap_cache_mode)
+    remapper = Remapper(backend, cache)
+
+    # Samples are numbered in the order they are read, the files being
+    # sorted so that shards run on different hosts number them alike
+    paths = [f"{args.path_folder}/{path_file}"
+             for path_file in sorted(os.listdir(args.path_folder))]
+    order = "stream" if args.stream else "explore"
+    sampler = TTLSampler(args.sample_ttls, args.sample_helpers, args.seed)
+    checkpoint = Checkpoint('out/tables/checkpoint.json',
+                            fingerprint(paths, f"{order} {sampler} {args.shard}").hex(),
+                            args.checkpoint)
+    try:
+        resumed = args.resume and checkpoint.load()
+    except ValueError as error:
+        sys.exit(str(error))
+    if resumed:
+        print("Resuming after remap", checkpoint.job)
+        restore_counts(checkpoint.counts)
+        tables.start('out/tables', checkpoint.tables)
+    else:
+        checkpoint.clear()
+        tables.start('out/tables')
+
+    # Streamed samples are only counted as they are read
+    if not args.stream:
+        print_info()
+
+    total = None if args.stream else len(samples)
+    start = time.perf_counter()
+    done = deque()
+    jobs = remap_jobs(samples, total, done, checkpoint, sampler, args.shard)
+    try:
+        for (sample_id, zone_id, weight), remap in remapper.map(jobs, args.concurrency):
+            # Results come in order, earlier samples are finished
+            while done and done[0][0] < sample_id:
+                done.popleft()[1].pack()
+            # The results before this one are in the tables
+            if checkpoint.due():
+                checkpoint.save(counts())
+            checkpoint.job = (sample_id, zone_id, remap.ttl)
+            sample = remap.sample
+            status_count[remap.status] += 1
+
+            if remap.status == Remapper.Status.ERROR:
+                log.write("Remap error\n")
+                log.write(remap.data + "\n\n")
+                continue
+            
+            #if remap.status == Remapper.Status.DIFFERENT:
+            #    expected = '|'.join([str(hop) for hop in Remapper.expected_solution(sample, remap.ttl)[0]])
+            #    log.write("Unexpected result\n")
+            #    log.write(remap.data + "\n")
+            #    log.write("EXPECTED " + expected + '\n')
+            #    log.write("GIVEN " + str(remap.result) + '\n')
+            #    log.write("\n")
+            #    continue
+            
+            data = remap.output.split()
+            
+            if sample.new_route.metadata.nprobes < int(data[0]):
+                PathManager.info["more probes"] += 1
+            else:
+                PathManager.info["less probes"] += 1
+            
+
+            if sample.new_route.metadata.nprobes < int(data[0]):
+                log.write("So much probes\n")
+                log.write(remap.data + "\n\n")
+                log.write(f"{sample.old_route.metadata.nprobes} {int(data[0])}")
+                continue
+            
+            tables.add_row('detection', [sample_id, zone_id,
+                                         remap.ttl, int(data[-2]), int(data[0]),
+                                         sample.old_route.metadata.nprobes,
+                                         float(data[-1]),
+                                         remap.status == Remapper.Status.OK_MULTIPLE,
+                                         remap.status == Remapper.Status.UNRESPONSIVE, 
+                                         remap.status == Remapper.Status.NO_REMAP,
+                                         weight])
+            
+            #assert int(data[-1]) > 0
+    except KeyboardInterrupt:
+        # The result handled may be half written, --resume goes back
+        # to the last checkpoint
         print(status_count)
         tables.save('out/tables')
-        log.close()
-        
-        print(PathManager.info["more probes"], "/", 
-              PathManager.info["less probes"])
+        exit(0)
+    finally:
+        # Stops the worker of the backend, whatever ended the loop
+        remapper.close()
+
+    # Saving the rows left in the tables
+    print(status_count)
+    checkpoint.save(counts())
+    tables.save('out/tables')
+    log.close()
+    if cache is not None:
+        print("Remap cache", cache.hits, "hits", cache.misses, "misses")
+    elapsed = time.perf_counter() - start
+    print(f"{sample_count[0]} samples in {elapsed:.1f} s,",
+          f"{sample_count[0] / elapsed:.1f} samples/s")
+
+    if args.stream:
+        print_info()
+    
+    print(PathManager.info["more probes"], "/", 
+          PathManager.info["less probes"])
@@ -1,30 +1,42 @@
 from tabulate import tabulate
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-import matplotlib as mlp
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+import json
 import os
+import time
 
 import extern
+from statstore import StatsStore
 
 def show(text : str, value : float):
     print(text, ": %.2f" % (value*100))
 
-src = 'out/tables'
-sample = pd.read_csv(f'{src}/sample.csv')
-detection = pd.read_csv(f'{src}/detection.csv')
-zone = pd.read_csv(f'{src}/zone.csv')
+# Steps drawn for each CDF, at most
+CDF_POINTS = 2000
 
-# TABLE
+def read_tables(src = 'out/tables'):
+    sample = pd.read_csv(f'{src}/sample.csv')
+    detection = pd.read_csv(f'{src}/detection.csv')
+    zone = pd.read_csv(f'{src}/zone.csv')
 
-sample_lcz_count = zone.groupby('sample_id').size()
-mult_lcz_sample_ids = set(sample_lcz_count[sample_lcz_count > 1].index)
-mult_lcz_samples = zone[zone['sample_id'].isin(mult_lcz_sample_ids)]
-single_lcz_samples = zone[~zone['sample_id'].isin(mult_lcz_sample_ids)]
-first_lcz_len = mult_lcz_samples[mult_lcz_samples['zone_id'] == 0]['new_len'].values
-all_lczs_len = mult_lcz_samples.groupby('sample_id')['new_len'].sum().values
-probing_cost_saving = detection['probing_cost_local'] / detection['probing_cost_complete']
+    # Detection rows of sampled runs (--sample-ttls) count as many TTLs
+    # as their weight
+    if 'weight' not in detection:
+        detection['weight'] = 1.0
+    return sample, zone, detection
+
+def fraction(df, mask):
+    return df['weight'][mask].sum() / df['weight'].sum()
+
+def weighted(series, df):
+    '''
+        Total weight of each value of a series of `df` rows, for
+        scratch.gen_cdf_dict.
+    '''
+    return df['weight'][series.index].groupby(series.values).sum().to_dict()
 
 def savings(df):
     rates = ((df['probing_cost_complete']
@@ -32,143 +44,226 @@ def savings(df):
         / df['probing_cost_complete'])
     return rates[rates >= 0]
 
-output = pd.DataFrame.from_dict({
-    'info': [
-        '3 more hops measured',
-        'Remove only',
-        'Probing save > 50%',
-        'Probing saving AVG',
-        'Single LCZ',
-        'Multiple remap',
-        'Radii < 4',
-        'Twisted routers'
-    ],
-    'value': (np.array([
-        (detection['measures'] >= 3).sum() / len(detection),
-        len(zone[zone['new_len'] < 2]) / len(zone),
-        (savings(detection) > 0.5).sum() / len(savings(detection)),
-        #(probing_cost_saving < 0.5).sum() / len(probing_cost_saving),
-        (1 - probing_cost_saving).mean(),
-        1 - len(mult_lcz_sample_ids) / len(zone.groupby('sample_id').min()),
-        detection[detection['sample_id'].isin(mult_lcz_sample_ids)]['multiple_remap'].sum() \
-            / len(detection[detection['sample_id'].isin(mult_lcz_sample_ids)]),#1 - (first_lcz_len / all_lczs_len).mean(),
-        (detection['ttl'] < 4).sum() / len(detection),
-        sample['twist'].sum() / len(sample)
-    ])*100).round(2)
-})
-
-print('\n'+tabulate(
-    output,
-    showindex = False,
-    numalign = 'right',
-    headers = ['INFO', '%'],
-    tablefmt = 'github'
-)+'\n')
-
-# 0 hops
-
-short_samples = set(sample[sample['new_path_len'] < 10]['sample_id'])
-long_samples = set(sample[sample['new_path_len'] > 20]['sample_id'])
-short_detections = detection[detection['sample_id'].map(lambda id : id in short_samples)]
-long_detections = detection[detection['sample_id'].map(lambda id : id in long_samples)]
-
-plot_data = [
-    {
-        'filename': 'probing_cost_savings',
-        'plots': [
-            (savings(short_detections), 'Short paths'),
-            (savings(long_detections), 'Long paths'),
-            (savings(detection), 'All paths')
-        ],
-        'title': 'Probing Cost Savings (%)',
-        'loc': 2,
-    },
-    {
-        'filename': 'probing_cost_local',
-        'plots': [
-            (detection.groupby('sample_id')['probing_cost_local'].min(), 'Minimum'),
-            (detection.groupby('sample_id')['probing_cost_local'].max(), 'Maximum'),
-            (detection.groupby('sample_id')['probing_cost_local'].mean(), 'Average'),
-        ],
-        'title': 'Probing Cost',
-        'loc': 4,
-    },
-    {
-        'filename': 'probing_cost_compare',
-        'plots': [
-            (detection['probing_cost_local'], 'Probing cost local'),
-            (detection['probing_cost_complete'], 'Probing cost complete')
-        ],
-        'title': 'Probing Cost',
-        'loc': 4,
-    },
-    {
-        'filename': 'hops_measured',
-        'plots': [
-            (detection['measures'], 'Local'),
-            (detection.apply(
-                lambda row : sample.iloc[row['sample_id']]['new_path_len'], axis = 1), 
-                'Complete')   
-        ],
-        'title': 'Number of Hops Measured',
-        'loc': 4,
-    },
-    {
-        'filename': 'added_hops',
-        'plots': [
-            (zone['new_len'], 'Added hops')  
-        ],
-        'title': 'Number of added hops',
-        'loc': 4,
-    },
-    {
-        'filename': 'added_hops_frac',
-        'plots': [
-            (zone['new_len'] / zone['sample_id']
-                .apply(lambda id : sample.iloc[id]['new_path_len']),
-                'Fraction of added hops')
-        ],
-        'title': 'Fraction of Added Hops\n(relative no new path length)',
-        'loc': 4,
-    },
-    {
-        'filename': 'change_zones',
-        'plots': [
-            (zone.groupby('sample_id').size(), 'Number of local change zones')  
+def summary(sample, zone, detection):
+    '''
+        The table of metrics and the series of each graph, from the
+        tables of a run. Rows are joined on sample_id with column
+        operations and groupbys, so the samples of the zone and
+        detection rows do not need to be at their position in `sample`.
+    '''
+    new_path_len = sample.set_index('sample_id')['new_path_len']
+    detection_path_len = detection['sample_id'].map(new_path_len)
+    zone_path_len = zone['sample_id'].map(new_path_len)
+
+    # TABLE
+
+    sample_lcz_count = zone.groupby('sample_id').size()
+    mult_lcz_sample_ids = sample_lcz_count.index[sample_lcz_count > 1]
+    probing_cost_saving = detection['probing_cost_local'] / detection['probing_cost_complete']
+    mult_lcz_detections = detection[detection['sample_id'].isin(mult_lcz_sample_ids)]
+    detection_savings = savings(detection)
+
+    output = pd.DataFrame.from_dict({
+        'info': [
+            '3 more hops measured',
+            'Remove only',
+            'Probing save > 50%',
+            'Probing saving AVG',
+            'Single LCZ',
+            'Multiple remap',
+            'Radii < 4',
+            'Twisted routers'
         ],
-        'title': 'Number of Local Change Zones',
-        'loc': 4,
-    }
-]
+        'value': (np.array([
+            fraction(detection, detection['measures'] >= 3),
+            (zone['new_len'] < 2).sum() / len(zone),
+            fraction(detection.loc[detection_savings.index], detection_savings > 0.5),
+            #(probing_cost_saving < 0.5).sum() / len(probing_cost_saving),
+            np.average(1 - probing_cost_saving, weights = detection['weight']),
+            1 - len(mult_lcz_sample_ids) / len(sample_lcz_count),
+            fraction(mult_lcz_detections, mult_lcz_detections['multiple_remap']),
+            fraction(detection, detection['ttl'] < 4),
+            sample['twist'].sum() / len(sample)
+        ])*100).round(2)
+    })
 
-import scratch
-import plot
+    # 0 hops
 
-for data in plot_data:
-    figure, axes = plt.subplots(figsize = (8,8))
-    legend_lines = []
-    legend_labels = []
-    cmap = plt.cm.coolwarm
+    short_detections = detection[detection_path_len < 10]
+    long_detections = detection[detection_path_len > 20]
+    cost = detection.groupby('sample_id')['probing_cost_local']
+    cost_weight = detection['probing_cost_local'] * detection['weight']
 
-    points = []
-    
-    for i, (series, label) in enumerate(data['plots']):
-        cdf = scratch.gen_cdf_list(list(series))
-        x = [0]
-        y = [0]
-        for a,b in cdf:
-            x.append(a)
-            y.append(b)
-        points.append(("step", x, y, plot.colors[i], label))
+    plot_data = [
+        {
+            'filename': 'probing_cost_savings',
+            'plots': [
+                (weighted(savings(short_detections), detection), 'Short paths'),
+                (weighted(savings(long_detections), detection), 'Long paths'),
+                (weighted(detection_savings, detection), 'All paths')
+            ],
+            'title': 'Probing Cost Savings (%)',
+            'loc': 2,
+        },
+        {
+            'filename': 'probing_cost_local',
+            'plots': [
+                (cost.min(), 'Minimum'),
+                (cost.max(), 'Maximum'),
+                (cost_weight.groupby(detection['sample_id']).sum()
+                    / detection.groupby('sample_id')['weight'].sum(), 'Average'),
+            ],
+            'title': 'Probing Cost',
+            'loc': 4,
+        },
+        {
+            'filename': 'probing_cost_compare',
+            'plots': [
+                (weighted(detection['probing_cost_local'], detection), 'Probing cost local'),
+                (weighted(detection['probing_cost_complete'], detection), 'Probing cost complete')
+            ],
+            'title': 'Probing Cost',
+            'loc': 4,
+        },
+        {
+            'filename': 'hops_measured',
+            'plots': [
+                (weighted(detection['measures'], detection), 'Local'),
+                (weighted(detection_path_len, detection), 'Complete')
+            ],
+            'title': 'Number of Hops Measured',
+            'loc': 4,
+        },
+        {
+            'filename': 'added_hops',
+            'plots': [
+                (zone['new_len'], 'Added hops')
+            ],
+            'title': 'Number of added hops',
+            'loc': 4,
+        },
+        {
+            'filename': 'added_hops_frac',
+            'plots': [
+                (zone['new_len'] / zone_path_len, 'Fraction of added hops')
+            ],
+            'title': 'Fraction of Added Hops\n(relative no new path length)',
+            'loc': 4,
+        },
+        {
+            'filename': 'change_zones',
+            'plots': [
+                (sample_lcz_count, 'Number of local change zones')
+            ],
+            'title': 'Number of Local Change Zones',
+            'loc': 4,
+        }
+    ]
+    return output, plot_data
 
-    filename = data['filename']
+def figures(plot_data, folder = 'out/graphs'):
+    '''
+        The (points, options) of plot.plot_graph for each graph.
+    '''
+    import scratch
+    import plot
+
+    jobs = []
+    for data in plot_data:
+        points = []
+        for i, (series, label) in enumerate(data['plots']):
+            if isinstance(series, dict):
+                cdf = scratch.gen_cdf_dict(series, points = CDF_POINTS)
+            else:
+                cdf = scratch.gen_cdf_list(series, points = CDF_POINTS)
+            x = [0]
+            y = [0]
+            for a,b in cdf:
+                x.append(a)
+                y.append(b)
+            points.append(("step", x, y, plot.colors[i], label))
+
+        filename = data['filename']
+        jobs.append((points, {
+            'xlabel': data['title'],
+            'ylabel': "Cumulative fraction of changes",
+            'filename': f'{folder}/{filename}.pdf',
+            'loc': data['loc']
+        }))
+    return jobs
+
+def render(jobs, folder = 'out/graphs', processes = None, force = False):
+    '''
+        Plot the (points, options) jobs with plot.plot_graph in a pool
+        of `processes`. Each graph is keyed by the hash of its points,
+        its options and plot.py, kept in `folder`/figures.json, and is
+        only plotted again if its key changed or its file is missing.
+        Return the files plotted.
+    '''
+    import plot
+
+    os.makedirs(folder, exist_ok = True)
+    manifest = f'{folder}/figures.json'
+    try:
+        with open(manifest) as file:
+            keys = json.load(file)
+    except (OSError, ValueError):
+        keys = dict()
+
+    with open(plot.__file__, 'rb') as file:
+        code = hashlib.sha256(file.read()).hexdigest()
+    pending = []
+    for points, options in jobs:
+        key = hashlib.sha256(repr((code, points, sorted(options.items()))).encode()).hexdigest()
+        filename = options['filename']
+        if force or keys.get(filename) != key or not os.path.exists(filename):
+            keys.pop(filename, None)
+            pending.append((key, points, options))
+
+    if processes == 1 or len(pending) < 2:
+        for key, points, options in pending:
+            plot.plot_graph(points, **options)
+            keys[options['filename']] = key
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [(key, options, executor.submit(plot.plot_graph, points, **options))
+                       for key, points, options in pending]
+            for key, options, future in futures:
+                future.result()
+                keys[options['filename']] = key
+
+    with open(manifest, 'w') as file:
+        json.dump(keys, file, indent = 1)
+    return [options['filename'] for _, _, options in pending]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = 'Remap Simulator Stats')
+    parser.add_argument("-j", "--jobs", type = int, default = os.cpu_count(),
+                        help = "processes plotting the graphs")
+    parser.add_argument("--force", action = "store_true",
+                        help = "plot the graphs that did not change too")
+    parser.add_argument("--rebuild", action = "store_true",
+                        help = "read the tables again instead of the rows added since the last run")
+    args = parser.parse_args()
+
+    # Aggregates kept since the last run, updated with the new rows
+    store = StatsStore() if args.rebuild else StatsStore.load()
+    store.update()
+    store.save()
+    output, plot_data = store.summary()
 
-    plot.plot_graph(points,
-        xlabel = data['title'],
-        ylabel = "Cumulative fraction of changes",
-        filename = f'out/graphs/{filename}.pdf',
-        loc = data['loc'])
+    print('\n'+tabulate(
+        output,
+        showindex = False,
+        numalign = 'right',
+        headers = ['INFO', '%'],
+        tablefmt = 'github'
+    )+'\n')
 
+    start = time.perf_counter()
+    plotted = render(figures(plot_data), processes = args.jobs, force = args.force)
+    print(f"{len(plotted)} of {len(plot_data)} graphs plotted "
+          f"in {time.perf_counter() - start:.1f} s")
 
 '''
         print(cdf)
@@ -0,0 +1,338 @@
+import hashlib
+import io
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import tables
+
+# Aggregation of the columns kept for each sample
+SAMPLE_AGG = {
+    'path_len': 'max',
+    'zones': 'sum',
+    'detections': 'sum',
+    'cost_min': 'min',
+    'cost_max': 'max',
+    'cost_sum': 'sum',
+    'weight': 'sum',
+    'multiple': 'sum'
+}
+
+# Bytes hashed at the start of a table and before the offset read
+WINDOW = 4096
+
+
+class StatsStore:
+    '''
+        Aggregates of the tables of a run, kept in `<folder>.stats` and
+        updated with the rows appended to the tables since the last
+        update, for stats.py. It keeps:
+
+            samples   per sample aggregates, indexed by sample_id
+            zones     sample_id and new_len of each zone
+            costs     detection weight by (probing_cost_local,
+                      probing_cost_complete), and the same for short
+                      (< 10 hops) and long (> 20 hops) paths
+            measures  detection weight by measures
+
+        Detection rows of samples whose sample row was not read yet wait
+        in `pending` to be counted as short or long. If a table is not
+        the one read before, as after a new run or a --resume going
+        back, everything is read again.
+    '''
+    VERSION = 2
+
+    def __init__(self, folder : str = 'out/tables'):
+        self.folder = folder.rstrip('/')
+        self.path = f'{self.folder}.stats'
+        self.reset()
+
+    def reset(self):
+        self.offsets = {table_name: 0 for table_name in tables.columns}
+        self.names = dict()
+        self.hashes = dict()
+        self.samples = pd.DataFrame(columns = list(SAMPLE_AGG), dtype = float)
+        self.samples.index.name = 'sample_id'
+        self.zones = pd.DataFrame({'sample_id': np.array([], dtype = np.int64),
+                                   'new_len': np.array([], dtype = np.int64)})
+        self.costs = StatsStore.no_costs()
+        self.short_costs = StatsStore.no_costs()
+        self.long_costs = StatsStore.no_costs()
+        self.measures = pd.Series(dtype = float)
+        self.pending = None
+        self.sample_rows = 0
+        self.twists = 0
+        self.ttl_weight = 0.0
+
+    @staticmethod
+    def load(folder : str = 'out/tables'):
+        '''
+            The store of the tables in `folder`, empty if it was never
+            saved or was saved by another version.
+        '''
+        store = StatsStore(folder)
+        try:
+            with open(store.path, 'rb') as file:
+                version, state = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return store
+        if version == StatsStore.VERSION:
+            store.__dict__.update(state)
+        return store
+
+    def save(self):
+        with open(f'{self.path}.tmp', 'wb') as file:
+            pickle.dump((StatsStore.VERSION, self.__dict__), file)
+        os.replace(f'{self.path}.tmp', self.path)
+
+    @staticmethod
+    def windows(file, end : int) -> tuple[str, str]:
+        '''
+            Hashes of the first and of the last bytes before `end`.
+        '''
+        hashes = []
+        for start, stop in ((0, min(WINDOW, end)), (max(end - WINDOW, 0), end)):
+            file.seek(start)
+            hashes.append(hashlib.sha256(file.read(stop - start)).hexdigest())
+        return tuple(hashes)
+
+    def changed(self, table_name : str) -> bool:
+        '''
+            Whether the part of a table read before is not in its file
+            anymore.
+        '''
+        offset = self.offsets[table_name]
+        if not offset:
+            return False
+        with open(f'{self.folder}/{table_name}.csv', 'rb') as file:
+            if os.fstat(file.fileno()).st_size < offset:
+                return True
+            return StatsStore.windows(file, offset) != self.hashes[table_name]
+
+    def read(self, table_name : str) -> pd.DataFrame | None:
+        '''
+            The complete rows appended to a table since the last read.
+        '''
+        offset = self.offsets[table_name]
+        with open(f'{self.folder}/{table_name}.csv', 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+            # Rows still being written are left for the next read
+            data = data[:data.rfind(b'\n') + 1]
+            if not data:
+                return None
+            end = offset + len(data)
+            self.hashes[table_name] = StatsStore.windows(file, end)
+        self.offsets[table_name] = end
+
+        if not offset:
+            header, data = data.split(b'\n', 1)
+            self.names[table_name] = header.decode().rstrip('\r').split(',')
+        if not data:
+            return None
+        return pd.read_csv(io.BytesIO(data), header = None, names = self.names[table_name])
+
+    def update(self):
+        '''
+            Add the rows appended to the tables, reading them all again
+            if any table changed.
+        '''
+        if any(self.changed(table_name) for table_name in tables.columns):
+            self.reset()
+        self.add(*[self.read(table_name) for table_name in ('sample', 'zone', 'detection')])
+
+    def merge(self, new : pd.DataFrame):
+        '''
+            Aggregate per sample the rows of `new`, aggregating again
+            only the samples from the first one of `new` on.
+        '''
+        if new.empty:
+            return
+        new = new.reindex(columns = list(SAMPLE_AGG)).astype(float)
+        cut = self.samples.index.searchsorted(new.index.min())
+        tail = pd.concat([self.samples.iloc[cut:], new]).groupby(level = 0).agg(SAMPLE_AGG)
+        self.samples = pd.concat([self.samples.iloc[:cut], tail])
+
+    @staticmethod
+    def no_costs() -> pd.Series:
+        '''
+            Empty detection weight by (probing_cost_local,
+            probing_cost_complete), as kept until a row is added.
+        '''
+        index = pd.MultiIndex.from_arrays(
+            [np.array([], dtype = np.int64)] * 2,
+            names = ['probing_cost_local', 'probing_cost_complete'])
+        return pd.Series(dtype = float, index = index)
+
+    @staticmethod
+    def add_costs(hist : pd.Series, rows : pd.DataFrame) -> pd.Series:
+        new = rows.groupby(['probing_cost_local', 'probing_cost_complete'])['weight'].sum()
+        return new if hist.empty else hist.add(new, fill_value = 0)
+
+    def add(self, sample, zone, detection):
+        if sample is not None:
+            self.sample_rows += len(sample)
+            self.twists += int(sample['twist'].sum())
+            self.merge(pd.DataFrame({'path_len': sample['new_path_len'].values},
+                                    index = sample['sample_id'].values))
+
+        if zone is not None:
+            self.zones = pd.concat([self.zones, zone[['sample_id', 'new_len']]],
+                                   ignore_index = True)
+            self.merge(pd.DataFrame({'zones': zone.groupby('sample_id').size()}))
+
+        if detection is not None:
+            if 'weight' not in detection:
+                detection['weight'] = 1.0
+            detection = detection[['sample_id', 'ttl', 'measures', 'probing_cost_local',
+                                   'probing_cost_complete', 'multiple_remap', 'weight']]
+            groups = detection.assign(
+                cost = detection['probing_cost_local'] * detection['weight'],
+                multiple = detection['multiple_remap'] * detection['weight']
+            ).groupby('sample_id')
+            self.merge(pd.DataFrame({
+                'detections': groups.size(),
+                'cost_min': groups['probing_cost_local'].min(),
+                'cost_max': groups['probing_cost_local'].max(),
+                'cost_sum': groups['cost'].sum(),
+                'weight': groups['weight'].sum(),
+                'multiple': groups['multiple'].sum()
+            }))
+            self.costs = StatsStore.add_costs(self.costs, detection)
+            measures = detection.groupby('measures')['weight'].sum()
+            self.measures = measures if self.measures.empty \
+                else self.measures.add(measures, fill_value = 0)
+            self.ttl_weight += detection['weight'][detection['ttl'] < 4].sum()
+            rows = detection if self.pending is None else pd.concat([self.pending, detection])
+        else:
+            rows = self.pending
+
+        # Short and long paths, once the sample of the rows is known
+        if rows is not None:
+            path_len = rows['sample_id'].map(self.samples['path_len'])
+            short = rows[path_len < 10]
+            long = rows[path_len > 20]
+            if not short.empty:
+                self.short_costs = StatsStore.add_costs(self.short_costs, short)
+            if not long.empty:
+                self.long_costs = StatsStore.add_costs(self.long_costs, long)
+            self.pending = rows[path_len.isna()]
+
+    @staticmethod
+    def savings(costs : pd.Series):
+        local = costs.index.get_level_values(0).values
+        complete = costs.index.get_level_values(1).values
+        rates = (complete - local) / complete
+        keep = rates >= 0
+        return rates[keep], costs.values[keep]
+
+    @staticmethod
+    def weighted(values, weights) -> dict:
+        return pd.Series(weights).groupby(np.asarray(values)).sum().to_dict()
+
+    def summary(self):
+        '''
+            stats.summary() from the aggregates, with the distributions
+            of detection columns as {value: weight} dicts.
+        '''
+        samples = self.samples
+        zone_count = samples['zones'][samples['zones'] > 0]
+        mult_lcz = samples[samples['zones'] > 1]
+        measured = samples[samples['detections'] > 0]
+        rates, weights = StatsStore.savings(self.costs)
+        local = self.costs.index.get_level_values(0).values
+        complete = self.costs.index.get_level_values(1).values
+        total = self.measures.sum()
+
+        output = pd.DataFrame.from_dict({
+            'info': [
+                '3 more hops measured',
+                'Remove only',
+                'Probing save > 50%',
+                'Probing saving AVG',
+                'Single LCZ',
+                'Multiple remap',
+                'Radii < 4',
+                'Twisted routers'
+            ],
+            'value': (np.array([
+                self.measures[self.measures.index >= 3].sum() / total,
+                (self.zones['new_len'] < 2).sum() / len(self.zones),
+                weights[rates > 0.5].sum() / weights.sum(),
+                (self.costs.values * (1 - local / complete)).sum() / self.costs.sum(),
+                1 - len(mult_lcz) / len(zone_count),
+                mult_lcz['multiple'].sum() / mult_lcz['weight'].sum(),
+                self.ttl_weight / total,
+                self.twists / self.sample_rows
+            ])*100).round(2)
+        })
+
+        path_weight = measured.dropna(subset = ['path_len']).groupby('path_len')['weight'].sum()
+        plot_data = [
+            {
+                'filename': 'probing_cost_savings',
+                'plots': [
+                    (StatsStore.weighted(*StatsStore.savings(self.short_costs)), 'Short paths'),
+                    (StatsStore.weighted(*StatsStore.savings(self.long_costs)), 'Long paths'),
+                    (StatsStore.weighted(rates, weights), 'All paths')
+                ],
+                'title': 'Probing Cost Savings (%)',
+                'loc': 2,
+            },
+            {
+                'filename': 'probing_cost_local',
+                'plots': [
+                    (measured['cost_min'], 'Minimum'),
+                    (measured['cost_max'], 'Maximum'),
+                    (measured['cost_sum'] / measured['weight'], 'Average'),
+                ],
+                'title': 'Probing Cost',
+                'loc': 4,
+            },
+            {
+                'filename': 'probing_cost_compare',
+                'plots': [
+                    (StatsStore.weighted(local, self.costs.values), 'Probing cost local'),
+                    (StatsStore.weighted(complete, self.costs.values), 'Probing cost complete')
+                ],
+                'title': 'Probing Cost',
+                'loc': 4,
+            },
+            {
+                'filename': 'hops_measured',
+                'plots': [
+                    (self.measures.to_dict(), 'Local'),
+                    (path_weight.to_dict(), 'Complete')
+                ],
+                'title': 'Number of Hops Measured',
+                'loc': 4,
+            },
+            {
+                'filename': 'added_hops',
+                'plots': [
+                    (self.zones['new_len'], 'Added hops')
+                ],
+                'title': 'Number of added hops',
+                'loc': 4,
+            },
+            {
+                'filename': 'added_hops_frac',
+                'plots': [
+                    (self.zones['new_len'] / self.zones['sample_id'].map(samples['path_len']),
+                     'Fraction of added hops')
+                ],
+                'title': 'Fraction of Added Hops\n(relative no new path length)',
+                'loc': 4,
+            },
+            {
+                'filename': 'change_zones',
+                'plots': [
+                    (zone_count, 'Number of local change zones')
+                ],
+                'title': 'Number of Local Change Zones',
+                'loc': 4,
+            }
+        ]
+        return output, plot_data
@@ -0,0 +1,340 @@
+from array import array
+import functools
+import ipaddress
+import socket
+import struct
+import zlib
+
+STAR_INT = 0xFFFFFFFF
+
+# Interned IPs, numbered from 1 in the order they are first seen, with
+# id 0 kept for stars. Ids are only valid in the process that gave them.
+STAR_ID = 0
+IP_IDS = {STAR_INT: STAR_ID}
+HOP_KEYS = dict()
+
+
+def ip2int(ip : str) -> int:
+    '''
+        The address of a dotted quad as an integer, STAR_INT for "*".
+        Raises ValueError for anything else, as IPv4Address does, where
+        inet_aton would take "1" for 0.0.0.1.
+    '''
+    if ip == "*":
+        return STAR_INT
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        raise ValueError(f"{ip!r} is not an IPv4 address") from None
+
+
+def intern_ip(value : int) -> int:
+    ip_id = IP_IDS.get(value)
+    if ip_id is None:
+        ip_id = IP_IDS[value] = len(IP_IDS)
+    return ip_id
+
+
+def hop_key(ips) -> tuple[tuple, frozenset]:
+    '''
+        The ids of the interface IPs of a hop, in order and as a set.
+        Both are interned, so hops with the same interfaces share them.
+    '''
+    key = tuple(intern_ip(ip) for ip in ips)
+    found = HOP_KEYS.get(key)
+    if found is None:
+        found = HOP_KEYS[key] = (key, frozenset(key))
+    return found
+
+
+def hop_digest(ips, hops : int) -> int:
+    '''
+        Fingerprint of a hop sequence: the CRC-32 of the IPs of its
+        interfaces, in order, started from the number of hops. Routes
+        with the same hop keys have the same digest, the converse needs
+        the keys to be compared.
+    '''
+    return zlib.crc32(ips, hops)
+
+
+@functools.lru_cache(maxsize = 1 << 16)
+def address(value : int) -> ipaddress.IPv4Address:
+    '''
+        Shared IPv4Address objects for the integer addresses kept in
+        the store, so repeated IPs do not allocate a new object each.
+    '''
+    return ipaddress.IPv4Address(value)
+
+
+def write_column(file, column : array):
+    '''
+        Write an array as a 16 bytes header (typecode and length) and
+        its raw data padded to 8 bytes, so files can be memory-mapped.
+    '''
+    file.write(struct.pack("<c7xQ", column.typecode.encode(), len(column)))
+    data = column.tobytes()
+    file.write(data)
+    file.write(bytes(-len(data) % 8))
+
+
+def read_column(buffer, offset : int) -> tuple[array, int]:
+    '''
+        Read an array written by write_column() from a bytes-like object
+        or a memory map, returning it with the offset after it.
+    '''
+    typecode, length = struct.unpack_from("<c7xQ", buffer, offset)
+    column = array(typecode.decode())
+    offset += 16
+    size = length * column.itemsize
+    column.frombytes(buffer[offset:offset+size])
+    return column, offset + size + (-size % 8)
+
+
+class RouteStore:
+    '''
+        Columnar storage for routes. Every record keeps its hops and
+        interfaces in flat arrays: IPs as uint32, hop and interface
+        offsets as indexes into the next column, RTTs as float32.
+
+        A route that is modified after being stored is written over its
+        record when its hops keep the same hops, interfaces per hop and
+        flowids per interface (replace()), as when stars are fixed with
+        single interface hops in a lazy store. Otherwise it is appended
+        again as a new record and the old one is left dead, counted in
+        `dead`: a store grows by those records over what its routes
+        need, and copy() of the live records into a new store drops
+        them. Records are not shared, a route over one is its only
+        reader.
+
+        A `lazy` store keeps the text after the IP of each interface
+        instead of decoding flowids and RTTs into their columns.
+    '''
+
+    def __init__(self, lazy : bool = False):
+        self.lazy = lazy
+
+        # Per record
+        self.src = array('I')
+        self.dst = array('I')
+        self.tstamp = array('q')
+        self.nprobes = array('I')
+        self.request_tstamp = array('q')
+        self.logging_tstamp = array('q')
+        self.tool = array('B')
+        self.flags = array('B')
+        self.digest = array('I')
+        self.hop_offsets = array('I', [0])
+
+        # Per hop
+        self.ttl = array('H')
+        self.iface_offsets = array('I', [0])
+
+        # Per interface
+        self.ips = array('I')
+        self.rtts = array('f')
+        self.flowid_offsets = array('I', [0])
+        self.flowids = array('I')
+        self.iface_flags = dict()
+        self.raw = list()
+
+        # Records left behind by routes appended again
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.src)
+
+    def append(self, src, dst, tstamp, metadata, flags, hops) -> int:
+        '''
+            Store a route and return its record id. `metadata` is the
+            tuple (nprobes, request_tstamp, logging_tstamp, tool) and
+            `hops` a list of (ttl, ifaces), where each interface is the
+            tuple (ip, flowids, rtts, flags), or (ip, raw) if lazy.
+        '''
+        rid = len(self.src)
+        self.src.append(src)
+        self.dst.append(dst)
+        self.tstamp.append(tstamp)
+        nprobes, request_tstamp, logging_tstamp, tool = metadata
+        self.nprobes.append(nprobes)
+        self.request_tstamp.append(request_tstamp)
+        self.logging_tstamp.append(logging_tstamp)
+        self.tool.append(tool)
+        self.flags.append(flags)
+
+        for ttl, ifaces in hops:
+            self.ttl.append(ttl)
+            if self.lazy:
+                for ip, raw in ifaces:
+                    self.ips.append(ip)
+                    self.raw.append(raw)
+                self.iface_offsets.append(len(self.ips))
+                continue
+            for ip, flowids, rtts, ifflags in ifaces:
+                if ifflags:
+                    self.iface_flags[len(self.ips)] = ifflags
+                self.ips.append(ip)
+                self.rtts.extend(rtts)
+                self.flowids.extend(flowids)
+                self.flowid_offsets.append(len(self.flowids))
+            self.iface_offsets.append(len(self.ips))
+        self.hop_offsets.append(len(self.ttl))
+        first = self.iface_offsets[self.hop_offsets[rid]]
+        self.digest.append(hop_digest(self.ips[first:], len(hops)))
+
+        return rid
+
+    def replace(self, rid : int, hops) -> bool:
+        '''
+            Write `hops`, as given to append(), over those of record
+            `rid` if they have as many hops, interfaces per hop and
+            flowids per interface. Return whether they were written.
+        '''
+        h0, h1 = self.hop_offsets[rid], self.hop_offsets[rid+1]
+        if len(hops) != h1 - h0:
+            return False
+        for h, (_, ifaces) in zip(range(h0, h1), hops):
+            if len(ifaces) != self.iface_offsets[h+1] - self.iface_offsets[h]:
+                return False
+            if self.lazy:
+                continue
+            for i, iface in zip(self.iface_range(h), ifaces):
+                if len(iface[1]) != self.flowid_offsets[i+1] - self.flowid_offsets[i]:
+                    return False
+
+        for h, (ttl, ifaces) in zip(range(h0, h1), hops):
+            self.ttl[h] = ttl
+            for i, iface in zip(self.iface_range(h), ifaces):
+                self.ips[i] = iface[0]
+                if self.lazy:
+                    self.raw[i] = iface[1]
+                    continue
+                _, flowids, rtts, ifflags = iface
+                first = self.flowid_offsets[i]
+                self.flowids[first:first+len(flowids)] = array('I', flowids)
+                self.rtts[4*i:4*i+4] = array('f', rtts)
+                if ifflags:
+                    self.iface_flags[i] = ifflags
+                else:
+                    self.iface_flags.pop(i, None)
+        self.digest[rid] = hop_digest(self.ips[self.iface_offsets[h0]:self.iface_offsets[h1]],
+                                      len(hops))
+        return True
+
+    def copy(self, other, rid : int) -> int:
+        '''
+            Append record `rid` of store `other` and return its new id.
+            Columns are copied by slices, shifting the offsets.
+        '''
+        assert self.lazy == other.lazy
+        new = len(self.src)
+        for column in ("src", "dst", "tstamp", "nprobes", "request_tstamp",
+                       "logging_tstamp", "tool", "flags", "digest"):
+            getattr(self, column).append(getattr(other, column)[rid])
+
+        h0, h1 = other.hop_offsets[rid], other.hop_offsets[rid+1]
+        i0, i1 = other.iface_offsets[h0], other.iface_offsets[h1]
+        shift = len(self.ips) - i0
+        self.ttl.extend(other.ttl[h0:h1])
+        self.iface_offsets.extend(o + shift for o in other.iface_offsets[h0+1:h1+1])
+        self.hop_offsets.append(len(self.ttl))
+        self.ips.extend(other.ips[i0:i1])
+
+        if self.lazy:
+            self.raw.extend(other.raw[i0:i1])
+            return new
+
+        f0, f1 = other.flowid_offsets[i0], other.flowid_offsets[i1]
+        fshift = len(self.flowids) - f0
+        self.flowid_offsets.extend(o + fshift for o in other.flowid_offsets[i0+1:i1+1])
+        self.flowids.extend(other.flowids[f0:f1])
+        self.rtts.extend(other.rtts[4*i0:4*i1])
+        for i in range(i0, i1):
+            if i in other.iface_flags:
+                self.iface_flags[i + shift] = other.iface_flags[i]
+        return new
+
+    def hop_range(self, rid : int) -> range:
+        return range(self.hop_offsets[rid], self.hop_offsets[rid+1])
+
+    def iface_range(self, hop : int) -> range:
+        return range(self.iface_offsets[hop], self.iface_offsets[hop+1])
+
+    def hop_count(self, rid : int) -> int:
+        return self.hop_offsets[rid+1] - self.hop_offsets[rid]
+
+    def hop_keys(self, rid : int) -> list[tuple]:
+        return [tuple(self.ips[self.iface_offsets[h]:self.iface_offsets[h+1]])
+                for h in self.hop_range(rid)]
+
+    def interface(self, i : int) -> tuple:
+        '''
+            Return the tuple (ip, flowids, rtts, flags) of interface `i`,
+            or (ip, raw) if the store is lazy.
+        '''
+        if self.lazy:
+            return self.ips[i], self.raw[i]
+        flowids = self.flowids[self.flowid_offsets[i]:self.flowid_offsets[i+1]]
+        return (self.ips[i],
+                tuple(flowids),
+                tuple(self.rtts[4*i:4*i+4]),
+                self.iface_flags.get(i, ""))
+
+    def contains(self, rid : int, ip : int) -> bool:
+        first = self.iface_offsets[self.hop_offsets[rid]]
+        last = self.iface_offsets[self.hop_offsets[rid+1]]
+        return ip in self.ips[first:last]
+
+    # Columns in the order they are written by dump()
+    COLUMNS = ("src", "dst", "tstamp", "nprobes", "request_tstamp",
+               "logging_tstamp", "tool", "flags", "digest", "hop_offsets", "ttl",
+               "iface_offsets", "ips", "rtts", "flowid_offsets", "flowids")
+
+    def dump(self, file):
+        '''
+            Write the store to a binary file, one column after the other.
+        '''
+        def write_text(texts):
+            blob = array('B', "".join(texts).encode())
+            offsets = array('I', [0])
+            for text in texts:
+                offsets.append(offsets[-1] + len(text.encode()))
+            write_column(file, offsets)
+            write_column(file, blob)
+
+        file.write(struct.pack("<?7x", self.lazy))
+        for name in RouteStore.COLUMNS:
+            write_column(file, getattr(self, name))
+        write_column(file, array('I', self.iface_flags.keys()))
+        write_text(list(self.iface_flags.values()))
+        write_text(self.raw)
+
+    @staticmethod
+    def load(buffer, offset : int = 0):
+        '''
+            Read a store written by dump() from a bytes-like object or a
+            memory map, starting at `offset`.
+        '''
+        def read():
+            nonlocal offset
+            column, offset = read_column(buffer, offset)
+            return column
+
+        def read_text():
+            offsets = read()
+            blob = bytes(read())
+            return [blob[a:b].decode() for a, b in zip(offsets, offsets[1:])]
+
+        store = RouteStore(struct.unpack_from("<?7x", buffer, offset)[0])
+        offset += 8
+        for name in RouteStore.COLUMNS:
+            setattr(store, name, read())
+        store.iface_flags = dict(zip(read(), read_text()))
+        store.raw = read_text()
+        return store
+
+    def nbytes(self) -> int:
+        total = 0
+        for column in vars(self).values():
+            if isinstance(column, array):
+                total += column.buffer_info()[1] * column.itemsize
+        return total
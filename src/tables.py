@@ -1,17 +1,114 @@
-import pandas as pd
-
-table = {
-    'sample': pd.DataFrame(columns = ['sample_id', 'old_path_len', 'new_path_len', 'has_change', 'twist']),
-    'zone': pd.DataFrame(columns = ['sample_id', 'zone_id', 'old_len', 'new_len']),
-    'detection': pd.DataFrame(columns = ['sample_id', 'zone_id', 'ttl', 'measures',
-                                         'probing_cost_local', 'probing_cost_complete', 'latency',
-                                         'multiple_remap', 'reach_end', 'not_remaped'])
+import csv
+import heapq
+import os
+
+columns = {
+    'sample': ['sample_id', 'old_path_len', 'new_path_len', 'has_change', 'twist'],
+    'zone': ['sample_id', 'zone_id', 'old_len', 'new_len'],
+    'detection': ['sample_id', 'zone_id', 'ttl', 'measures',
+                  'probing_cost_local', 'probing_cost_complete', 'latency',
+                  'multiple_remap', 'reach_end', 'not_remaped', 'weight']
 }
 
+# Leading columns identifying the rows of each table, in their order
+keys = {'sample': 1, 'zone': 2, 'detection': 3}
+
+# Rows kept for each table before writing them
+CHUNK = 4096
+
+rows = {table_name: [] for table_name in columns}
+written = {table_name: 0 for table_name in columns}
+files = dict()
+
+def start(folder, state = None):
+    '''
+        Create the table files in `folder`, with the same layout as
+        DataFrame.to_csv, and write rows to them every CHUNK rows.
+        With the `state` returned by checkpoint(), the files are cut
+        back to it and rows are appended to them.
+    '''
+    os.makedirs(folder, exist_ok = True)
+    for table_name in columns:
+        path = f'{folder}/{table_name}.csv'
+        if state is None:
+            files[table_name] = open(path, 'w', newline = '')
+            writer(table_name).writerow([''] + columns[table_name])
+        else:
+            written[table_name], size = state[table_name]
+            files[table_name] = open(path, 'a', newline = '')
+            files[table_name].truncate(size)
+            # truncate() leaves the position at the old end, which
+            # checkpoint() would record with tell()
+            files[table_name].seek(0, os.SEEK_END)
+
+def writer(table_name):
+    return csv.writer(files[table_name], lineterminator = '\n')
+
 def add_row(table_name, row):
-    df = table[table_name] 
-    df.loc[len(df.index)] = row
+    rows[table_name].append(row)
+    if files and len(rows[table_name]) >= CHUNK:
+        flush(table_name)
+
+def flush(table_name):
+    # The first column is the row index
+    first = written[table_name]
+    writer(table_name).writerows([index, *row] for index, row
+                                 in enumerate(rows[table_name], first))
+    written[table_name] += len(rows[table_name])
+    rows[table_name].clear()
+    files[table_name].flush()
+
+def checkpoint():
+    '''
+        Write the rows kept and return the rows and bytes written to
+        each table, for start().
+    '''
+    state = dict()
+    for table_name in columns:
+        flush(table_name)
+        os.fsync(files[table_name].fileno())
+        state[table_name] = (written[table_name], files[table_name].tell())
+    return state
 
 def save(folder):
-    for table_name in table:
-        table[table_name].to_csv(f'{folder}/{table_name}.csv')
+    '''
+        Write the rows left, creating the files if start() was not
+        called, and close them.
+    '''
+    if not files:
+        start(folder)
+    for table_name in columns:
+        flush(table_name)
+        files[table_name].close()
+    files.clear()
+
+def merge(shards, folder):
+    '''
+        Write to `folder` the rows of the tables of all `shards`, in the
+        order of their keys. Shards keep the sample ids of the whole
+        run, so the tables are the ones of a run without shards.
+    '''
+    if any(os.path.realpath(shard) == os.path.realpath(folder) for shard in shards):
+        raise ValueError(f'{folder} is one of the shards')
+    start(folder)
+    for table_name in columns:
+        key = lambda row : tuple(map(int, row[:keys[table_name]]))
+        shard_files = [open(f'{shard}/{table_name}.csv', newline = '') for shard in shards]
+        try:
+            readers = []
+            for file in shard_files:
+                reader = csv.reader(file)
+                if next(reader, None) != [''] + columns[table_name]:
+                    raise ValueError(f'{file.name} is not a {table_name} table')
+                # Without the index column
+                readers.append(row[1:] for row in reader)
+            last = None
+            for row in heapq.merge(*readers, key = key):
+                if key(row) == last:
+                    raise ValueError(f'{table_name} row {last} is in more than one shard')
+                last = key(row)
+                add_row(table_name, row)
+        finally:
+            for file in shard_files:
+                file.close()
+    save(folder)
@@ -0,0 +1,46 @@
+'''
+    Route.diff against the changes and repaired hops recorded in
+    data/diff.json, for route pairs of synthetic traceroutes and every
+    option set. Routes are diffed parsed alone and from a route store,
+    the second time through the memo of Route.compare.
+'''
+import json
+import os
+
+import pytest
+
+from paths import PathManager
+from route import ALL_DIFFERENCE_OPTIONS, Route, RouteDifferenceOption
+from store import RouteStore
+
+with open(os.path.join(os.path.dirname(__file__), "data", "diff.json")) as file:
+    DATA = json.load(file)
+
+OPTIONS = {
+    "default": ALL_DIFFERENCE_OPTIONS,
+    "balancers": frozenset([RouteDifferenceOption.IGNORE_BALANCERS]),
+    "fix": frozenset([RouteDifferenceOption.FIX_UNRESPONSIVE]),
+    "fix+fill": frozenset([RouteDifferenceOption.FIX_UNRESPONSIVE,
+                           RouteDifferenceOption.FILL_MISSING_HOPS]),
+    "all": frozenset(RouteDifferenceOption),
+}
+
+
+def hops(route):
+    return [";".join(str(iface.ip) for iface in hop) for hop in route]
+
+
+@pytest.mark.parametrize("packed", [False, True], ids = ["routes", "store"])
+@pytest.mark.parametrize("case", DATA["cases"],
+                         ids = lambda case : f"{case['options']}-{case['pair'][0]}-{case['pair'][1]}")
+def test_diff(case, packed):
+    store = RouteStore() if packed else None
+    r1, r2 = (PathManager.read_route(DATA["lines"][i], store) for i in case["pair"])
+    before = [hops(r1), hops(r2)]
+    if "error" in case:
+        with pytest.raises(AssertionError):
+            Route.diff(r1, r2, OPTIONS[case["options"]])
+        return
+    changes = Route.diff(r1, r2, OPTIONS[case["options"]])
+    assert [str(change) for change in changes] == case["changes"]
+    assert [hops(r1), hops(r2)] == case.get("hops", before)
@@ -0,0 +1,56 @@
+'''
+    stats.summary and StatsStore against the metrics and graph series
+    recorded in data/stats/summary.json for the tables in data/stats.
+'''
+import json
+import os
+
+import numpy as np
+import pytest
+
+from statstore import StatsStore
+from stats import read_tables, summary
+
+FOLDER = os.path.join(os.path.dirname(__file__), "data", "stats")
+
+with open(os.path.join(FOLDER, "summary.json")) as file:
+    EXPECTED = json.load(file)
+
+
+def pairs(data):
+    '''
+        (key, value) rows of a graph series, a dict or a pandas Series.
+    '''
+    return np.array([[key, value] for key, value in data.items()], dtype = float).reshape(-1, 2)
+
+
+def check(output, plot_data):
+    assert output['value'].tolist() == EXPECTED['values']
+    found = [data for plots in plot_data for data, _ in plots['plots']]
+    assert len(found) == len(EXPECTED['series'])
+    for data, expected in zip(found, EXPECTED['series']):
+        assert np.allclose(pairs(data), np.array(expected, dtype = float).reshape(-1, 2))
+
+
+def test_summary():
+    check(*summary(*read_tables(FOLDER)))
+
+
+@pytest.mark.parametrize("steps", [1, 3])
+def test_store(steps, tmp_path):
+    '''
+        The store updated once, or with the rows appended in `steps`
+        parts as while simulate writes the tables.
+    '''
+    tables = dict()
+    for table_name in ("sample", "zone", "detection"):
+        with open(os.path.join(FOLDER, f"{table_name}.csv")) as file:
+            tables[table_name] = file.readlines()
+    store = StatsStore(str(tmp_path))
+    for step in range(1, steps + 1):
+        for table_name, lines in tables.items():
+            rows = 1 + (len(lines) - 1) * step // steps
+            with open(tmp_path / f"{table_name}.csv", "w") as file:
+                file.writelines(lines[:rows])
+        store.update()
+    check(*store.summary())